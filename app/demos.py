@@ -3,7 +3,6 @@ from pathlib import Path
 from uuid import uuid4
 import streamlit as st
 import pandas as pd
-import json
 import inspect
 
 from mysql.connector import MySQLConnection
@@ -70,13 +69,19 @@ def inout():
 
             case "Stream":
                 if st.button("Consume from 'incoming'"):
-                    messages = []
-                    for msg in streams.consume(constants.DEMO_STREAM, "incoming"):
-                        logger.info("Incoming %s", msg)
-                        messages.append(json.loads(msg))
-                    st.session_state["source_dataframe"] = pd.DataFrame(messages)
+                    lag = {}
+                    messages = streams.consume_dataframe(
+                        constants.DEMO_STREAM, "incoming", lag=lag
+                    )
+                    logger.info("Incoming %d messages", len(messages))
+                    st.session_state["source_dataframe"] = messages
                     if len(messages) == 0:
                         st.warning("No messages returned from consumer!")
+                    elif sum(lag.values()):
+                        # consume_batches stops after max_wait, offsets read so far are committed
+                        st.warning(
+                            f"Stopped before the end of the topic, {sum(lag.values())} messages left. Consume again to read more."
+                        )
 
             case _:
                 logger.debug("Source not selected!")
@@ -141,6 +146,12 @@ def inout():
                 key="save_to_bucket",
                 help="Select or create a new bucket",
             )
+            if st.session_state.get("format", None) == "parquet":
+                st.toggle(
+                    "Partitioned dataset",
+                    key="partitioned",
+                    help="Write parallel `key=value/part-NNNN.parquet` objects with a `_manifest.json`",
+                )
 
         if st.session_state.get("target", "") == "s3":
 
@@ -163,7 +174,33 @@ def inout():
 
                 filename = f"{st.session_state.destination_name}.{'csv' if content_type == 'text/csv' else 'json' if content_type == 'application/json' else 'parquet'}"
 
-                if st.button(
+                if st.session_state.get("partitioned", False) and content_type == "application/octet-stream":
+                    cols = st.columns(2)
+                    partition_by = cols[0].selectbox(
+                        "Partition by",
+                        options=list(df.columns),
+                        index=None,
+                        help="Leave empty to split by row count only",
+                    )
+                    rows_per_part = cols[1].number_input(
+                        "Rows per part", min_value=1000, value=100_000, step=10_000
+                    )
+                    if st.button(
+                        f"Put dataset {st.session_state.destination_name}/ in {st.session_state.save_to_bucket}",
+                        type="primary",
+                    ):
+                        manifest = s3.put_dataset(
+                            df=df,
+                            bucket_name=st.session_state.save_to_bucket,
+                            prefix=st.session_state.destination_name,
+                            partition_by=partition_by or "",
+                            rows_per_part=int(rows_per_part),
+                        )
+                        st.success(
+                            f"{len(manifest['parts'])} parts with {manifest['rows']} records uploaded to bucket {st.session_state.save_to_bucket}"
+                        )
+
+                elif st.button(
                     f"Put {filename} in {st.session_state.save_to_bucket}",
                     type="primary",
                 ):
@@ -221,13 +258,14 @@ def inout():
         with st.expander("S3 Client"):
             st.code(inspect.getsource(s3.get_client))
         with st.expander("S3 Bucket List"):
-            st.code(inspect.getsource(s3.list_bucket))
+            st.code(inspect.getsource(s3.iter_objects))
         with st.expander("S3 Put"):
             st.code(inspect.getsource(s3.put))
         with st.expander("Stream Producer"):
             st.code(inspect.getsource(streams.produce))
         with st.expander("Stream Consumer"):
-            st.code(inspect.getsource(streams.consume))
+            st.code(inspect.getsource(streams.consume_dataframe))
+            st.code(inspect.getsource(streams.consume_batches))
 
 
 def multi_tenancy():
@@ -120,13 +120,50 @@ async def main():
             demo["function"]()
 
     # List S3 bucket content
-    if st.session_state.get("bucket_content", None):
-        row = st.columns([5, 1], vertical_alignment="bottom")
-        row[0].write(f"Bucket {st.session_state['selected_bucket']} objects:")
+    page = st.session_state.get("bucket_content", None)
+    if page:
+        prefix = st.session_state["bucket_prefix"]
+        parent = prefix.rstrip("/").rpartition("/")[0]
+        row = st.columns([8, 1, 1, 1, 1], vertical_alignment="bottom")
+        row[0].write(f"Bucket {st.session_state['selected_bucket']}/{prefix} objects:")
         row[1].button(
-            "", icon="🔄", on_click=utils.set_bucket_list, key="btn_bucket_list"
+            "",
+            icon=":material/arrow_upward:",
+            on_click=utils.open_bucket_folder,
+            args=(parent + "/" if parent else "",),
+            disabled=not prefix,
+            help="Parent folder",
+            key="btn_bucket_up",
+        )
+        row[2].button(
+            "",
+            icon=":material/navigate_before:",
+            on_click=utils.previous_bucket_page,
+            disabled=len(st.session_state["bucket_tokens"]) < 2,
+            help="Previous page",
+            key="btn_bucket_prev",
+        )
+        row[3].button(
+            "",
+            icon=":material/navigate_next:",
+            on_click=utils.next_bucket_page,
+            disabled=not page["next"],
+            help="Next page",
+            key="btn_bucket_next",
         )
-        st.table(st.session_state["bucket_content"])
+        row[4].button(
+            "", icon="🔄", on_click=utils.refresh_bucket_list, key="btn_bucket_list"
+        )
+        for folder in page["folders"]:
+            st.button(
+                f"📁 {folder[len(prefix):]}",
+                on_click=utils.open_bucket_folder,
+                args=(folder,),
+                type="tertiary",
+                key=f"btn_bucket_folder_{folder}",
+            )
+        if page["objects"]:
+            st.table(page["objects"])
 
     # List folder content
     if st.session_state.get("folder_content", None):
@@ -1,7 +1,14 @@
 import configparser
+import io
+import json
+import threading
+import timeit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import boto3
-from io import StringIO, BytesIO
+from botocore.config import Config
+from urllib.parse import quote
 import logging
 
 import constants
@@ -14,59 +21,337 @@ import os
 os.environ["AWS_REQUEST_CHECKSUM_CALCULATION"] = "when_required"
 os.environ["AWS_RESPONSE_CHECKSUM_VALIDATION"] = "when_required"
 
+# Overridable to point at a local S3 stand-in, e.g. for s3_bench
+CREDENTIALS_FILE = os.environ.get("S3_CREDENTIALS_FILE", "/home/mapr/.aws/credentials")
+ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", f"https://{constants.CLUSTER_NAME}:9000")
+# empty disables certificate verification
+CA_BUNDLE = os.environ.get("S3_CA_BUNDLE", "/root/.mc/certs/CAs/chain-ca.pem") or False
+MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
 
-def get_client():
+# boto3 clients are thread-safe, share one until the credentials file changes
+s3client = None
+s3client_mtime = None
+s3client_lock = threading.Lock()
+
+# Bucket and object listings, kept for LISTING_TTL seconds or until this process writes
+LISTING_TTL = float(os.environ.get("S3_LISTING_TTL", "30"))
+# Listings kept, least recently used dropped first
+LISTING_CACHE_SIZE = int(os.environ.get("S3_LISTING_CACHE_SIZE", "256"))
+listing_cache = OrderedDict()
+listing_stats = {"hits": 0, "misses": 0, "evictions": 0}
+listing_lock = threading.Lock()
+
+# Running totals per (bucket, prefix) for summarize_s3_folder
+SUMMARY_RESCAN_INTERVAL = float(os.environ.get("S3_SUMMARY_RESCAN_INTERVAL", "600"))
+folder_summaries = {}
+folder_summaries_lock = threading.Lock()
+
+
+def read_credentials():
     # Read AWS credentials from ~/.aws/credentials
     config = configparser.ConfigParser()
-    config.read("/home/mapr/.aws/credentials")
-
-    return boto3.client(
-        "s3",
-        aws_access_key_id=config["default"]["aws_access_key_id"],
-        aws_secret_access_key=config["default"]["aws_secret_access_key"],
-        endpoint_url=f"https://{constants.CLUSTER_NAME}:9000",
-        use_ssl=True,
-        # verify=False
-        verify="/root/.mc/certs/CAs/chain-ca.pem",
+    config.read(CREDENTIALS_FILE)
+
+    return (
+        config["default"]["aws_access_key_id"],
+        config["default"]["aws_secret_access_key"],
     )
 
 
-def put(df: pd.DataFrame, bucket_name: str, file_key: str, content_type: str):
-    client = get_client()
+def get_client():
+    global s3client, s3client_mtime
+
+    mtime = os.stat(CREDENTIALS_FILE).st_mtime
+
+    with s3client_lock:
+        if s3client is not None and s3client_mtime == mtime:
+            return s3client
+
+        access_key, secret_key = read_credentials()
+
+        s3client = boto3.client(
+            "s3",
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            endpoint_url=ENDPOINT_URL,
+            use_ssl=True,
+            # verify=False
+            verify=CA_BUNDLE,
+            config=Config(
+                max_pool_connections=MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+        s3client_mtime = mtime
+        logger.debug("New S3 client, credentials modified at %s", mtime)
+
+    return s3client
+
+
+CONTENT_TYPES = ["text/csv", "application/json", "application/octet-stream"]
+
+MULTIPART_PART_SIZE = 16 * 1024**2  # S3 minimum is 5 MiB except for the last part
+MULTIPART_WORKERS = 4
+ROWS_PER_CHUNK = 100_000
+
+
+def cached_listing(key: tuple, loader, ttl: float = None):
+    """
+    Return the cached listing for key, calling loader() if missing or expired
+
+    Expired listings are dropped on every insert, and the cache holds at most
+    LISTING_CACHE_SIZE listings.
+    """
+    ttl = LISTING_TTL if ttl is None else ttl
+    now = timeit.default_timer()
+
+    with listing_lock:
+        entry = listing_cache.get(key)
+        if entry is not None and entry[0] > now:
+            listing_cache.move_to_end(key)
+            listing_stats["hits"] += 1
+            logger.debug("S3 listing cache hit for %s %s", key, listing_stats)
+            return list(entry[1])
+        listing_stats["misses"] += 1
+
+    logger.info("S3 listing cache miss for %s %s", key, listing_stats)
+    value = loader()
+
+    with listing_lock:
+        now = timeit.default_timer()
+        for expired in [k for k, e in listing_cache.items() if e[0] <= now]:
+            del listing_cache[expired]
+
+        listing_cache[key] = (now + ttl, value)
+        listing_cache.move_to_end(key)
+        while len(listing_cache) > LISTING_CACHE_SIZE:
+            listing_cache.popitem(last=False)
+            listing_stats["evictions"] += 1
+
+    return list(value)
+
+
+def invalidate_listing(bucket_name: str = "", buckets: bool = False):
+    """
+    Drop cached object listings for the bucket, or everything if no bucket given
+
+    :param buckets bool: also drop the bucket list, only needed when a bucket is created or removed
+    """
+    with listing_lock:
+        if not bucket_name:
+            listing_cache.clear()
+            return
+        for key in list(listing_cache):
+            if (buckets and key == ("buckets",)) or (
+                key[0] == "objects" and key[1] == bucket_name
+            ):
+                del listing_cache[key]
+
+
+class MultipartWriter(io.RawIOBase):
+    """
+    Write-only file object that uploads to S3 in multipart parts as data arrives
+
+    Parts are uploaded concurrently, at most `2 * workers` parts are held in memory.
+    Objects smaller than one part are sent with a single put_object.
+    Leaving a `with` block on an exception aborts the upload.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket_name: str,
+        file_key: str,
+        content_type: str,
+        part_size: int = MULTIPART_PART_SIZE,
+        workers: int = MULTIPART_WORKERS,
+    ):
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.file_key = file_key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.position = 0
+        self.upload_id = None
+        self.futures = []
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers * 2)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def upload_part(self, body: bytes):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.file_key,
+                ContentType=self.content_type,
+            )["UploadId"]
+            logger.debug("Started multipart upload for %s", self.file_key)
+
+        for future in self.futures:
+            if future.done() and future.exception():
+                raise future.exception()
+
+        self.slots.acquire()
+        self.futures.append(
+            self.pool.submit(self.send_part, len(self.futures) + 1, body)
+        )
+
+    def send_part(self, part_number: int, body: bytes):
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket_name,
+                Key=self.file_key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            self.slots.release()
+
+    def complete(self):
+        if self.upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.file_key,
+                Body=bytes(self.buffer),
+                ContentType=self.content_type,
+            )
+            invalidate_listing(self.bucket_name)
+            return
+
+        if self.buffer:
+            self.upload_part(bytes(self.buffer))
+            self.buffer.clear()
+
+        parts = [future.result() for future in self.futures]
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.file_key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        invalidate_listing(self.bucket_name)
+        logger.debug("Completed %d part upload for %s", len(parts), self.file_key)
+
+    def abort(self):
+        self.pool.shutdown(cancel_futures=True)
+        if self.upload_id is not None:
+            logger.warning("Aborting multipart upload for %s", self.file_key)
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.file_key, UploadId=self.upload_id
+            )
+        self.buffer.clear()
+        super().close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.complete()
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.pool.shutdown()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
 
+
+def ensure_bucket(bucket_name: str):
     # Create bucket if missing
     if not bucket_name in list_buckets():
         try:
-            client.create_bucket(Bucket=bucket_name)
+            get_client().create_bucket(Bucket=bucket_name)
+            invalidate_listing(bucket_name, buckets=True)
         except Exception as e:
             logger.error(e)
             raise e
 
-    # Convert DataFrame to the appropriate format based on content type
+
+def write_dataframe(
+    df: pd.DataFrame, out, content_type: str, rows_per_chunk: int = ROWS_PER_CHUNK
+):
+    """
+    Encode the DataFrame into a writable file object, chunk by chunk
+
+    CSV and NDJSON are rendered `rows_per_chunk` rows at a time,
+    Parquet writes one row group per chunk.
+    """
     if content_type == "text/csv":
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False)
-        body = csv_buffer.getvalue()
+        for start in range(0, max(len(df), 1), rows_per_chunk):
+            chunk = df.iloc[start : start + rows_per_chunk]
+            out.write(chunk.to_csv(index=False, header=start == 0).encode("utf-8"))
 
     elif content_type == "application/json":
-        json_buffer = StringIO()
-        df.to_json(json_buffer, orient="records", lines=True)
-        body = json_buffer.getvalue()
+        for start in range(0, len(df), rows_per_chunk):
+            chunk = df.iloc[start : start + rows_per_chunk]
+            body = chunk.to_json(orient="records", lines=True)
+            if not body.endswith("\n"):
+                body += "\n"
+            out.write(body.encode("utf-8"))
 
     elif content_type == "application/octet-stream":  # Parquet format
-        parquet_buffer = BytesIO()
-        df.to_parquet(parquet_buffer, index=False)
-        body = parquet_buffer.getvalue()
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        with pq.ParquetWriter(out, schema) as writer:
+            for start in range(0, len(df), rows_per_chunk):
+                chunk = df.iloc[start : start + rows_per_chunk]
+                writer.write_table(
+                    pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                )
 
     else:
         raise ValueError(f"Unsupported content type: {content_type}")
 
+
+def put(
+    df: pd.DataFrame,
+    bucket_name: str,
+    file_key: str,
+    content_type: str,
+    part_size: int = MULTIPART_PART_SIZE,
+    workers: int = MULTIPART_WORKERS,
+):
+    client = get_client()
+
+    ensure_bucket(bucket_name)
+
+    if content_type not in CONTENT_TYPES:
+        raise ValueError(f"Unsupported content type: {content_type}")
+
     try:
         logger.info("Uploading file with key: %s", file_key)
-        # Write the file to S3
-        client.put_object(
-            Bucket=bucket_name, Key=file_key, Body=body, ContentType=content_type
-        )
+        # Stream the encoded DataFrame to S3, in parts if it is large
+        with MultipartWriter(
+            client, bucket_name, file_key, content_type, part_size, workers
+        ) as writer:
+            write_dataframe(df, writer, content_type)
         logger.info("Successfully uploaded %s to bucket %s.", file_key, bucket_name)
         return True
     except Exception as e:
@@ -74,62 +359,497 @@ def put(df: pd.DataFrame, bucket_name: str, file_key: str, content_type: str):
         raise e
 
 
-def list_buckets():
+def dataset_parts(df: pd.DataFrame, partition_by: str = "", rows_per_part: int = ROWS_PER_CHUNK):
+    """
+    Split the DataFrame into (partition path, part) pairs
+
+    With `partition_by`, rows are grouped by that column into Hive-style
+    `column=value` paths and the column is dropped from the part, as readers
+    restore it from the path. Each group is further split by `rows_per_part`.
+    """
+    if not partition_by:
+        for start in range(0, len(df), rows_per_part):
+            yield "", df.iloc[start : start + rows_per_part]
+        return
+
+    for value, group in df.groupby(partition_by, dropna=False, sort=True):
+        value = "__HIVE_DEFAULT_PARTITION__" if pd.isna(value) else str(value)
+        path = f"{partition_by}={quote(value, safe='')}/"
+        group = group.drop(columns=[partition_by])
+        for start in range(0, len(group), rows_per_part):
+            yield path, group.iloc[start : start + rows_per_part]
+
+
+def put_dataset(
+    df: pd.DataFrame,
+    bucket_name: str,
+    prefix: str,
+    partition_by: str = "",
+    rows_per_part: int = ROWS_PER_CHUNK,
+    workers: int = 8,
+):
+    """
+    Write the DataFrame as a partitioned Parquet dataset under the prefix
+
+    Parts are uploaded in parallel as `[column=value/]part-NNNN.parquet`, followed by
+    a `_manifest.json` listing every part with its row count and size.
+
+    :param df pd.DataFrame: data to write
+    :param bucket_name str: target bucket, created if missing
+    :param prefix str: dataset folder in the bucket
+    :param partition_by str: column to partition by, empty to split by row count only
+    :param rows_per_part int: max rows in each part
+    :param workers int: max concurrent uploads
+
+    :returns dict: manifest of the written dataset
+    """
+    client = get_client()
+    ensure_bucket(bucket_name)
+
+    prefix = prefix.rstrip("/") + "/"
+
+    def upload(number: int, path: str, part: pd.DataFrame):
+        key = f"{prefix}{path}part-{number:04d}.parquet"
+        body = part.to_parquet(index=False)
+        client.put_object(
+            Bucket=bucket_name,
+            Key=key,
+            Body=body,
+            ContentType="application/octet-stream",
+        )
+        return {"key": key, "rows": len(part), "bytes": len(body)}
+
+    tick = timeit.default_timer()
     try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(upload, number, path, part)
+                for number, (path, part) in enumerate(
+                    dataset_parts(df, partition_by, rows_per_part)
+                )
+            ]
+            parts = [future.result() for future in futures]
+
+        manifest = {
+            "format": "parquet",
+            "partition_by": [partition_by] if partition_by else [],
+            "rows": sum(p["rows"] for p in parts),
+            "bytes": sum(p["bytes"] for p in parts),
+            "parts": parts,
+        }
+        client.put_object(
+            Bucket=bucket_name,
+            Key=f"{prefix}_manifest.json",
+            Body=json.dumps(manifest, indent=2).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    except Exception as e:
+        logger.error(e)
+        raise e
+
+    finally:
+        invalidate_listing(bucket_name)
+
+    logger.info(
+        "Uploaded %d parts to s3://%s/%s in %.3f sec",
+        len(parts),
+        bucket_name,
+        prefix,
+        timeit.default_timer() - tick,
+    )
+    return manifest
+
+
+def list_buckets():
+    def load():
         client = get_client()
         buckets = client.list_buckets()
         logger.debug(buckets)
         return [b["Name"] for b in buckets["Buckets"]]
 
+    try:
+        return cached_listing(("buckets",), load)
+
+    except Exception as e:
+        logger.error(e)
+        raise e
+
+
+def object_row(o: dict):
+    return {
+        "Object Key": o["Key"],
+        "Size": o["Size"],
+        "Modified": o["LastModified"],
+    }
+
+
+def iter_objects(
+    bucket: str,
+    prefix: str = "",
+    delimiter: str = "",
+    page_size: int = 1000,
+    token: str = "",
+):
+    """
+    Lazily walk the bucket one list_objects_v2 page at a time
+
+    :param bucket str: bucket name
+    :param prefix str: only keys under this prefix
+    :param delimiter str: group keys into folders on this character, e.g. "/"
+    :param page_size int: max keys and folders per page
+    :param token str: continuation token to start from, empty for the first page
+
+    :returns generator[dict]: pages with "folders", "objects" and the "next" token, empty on the last page
+    """
+    client = get_client()
+
+    while True:
+        params = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": page_size}
+        if delimiter:
+            params["Delimiter"] = delimiter
+        if token:
+            params["ContinuationToken"] = token
+
+        response = client.list_objects_v2(**params)
+        token = response.get("NextContinuationToken", "")
+
+        yield {
+            "folders": [p["Prefix"] for p in response.get("CommonPrefixes", [])],
+            "objects": [object_row(o) for o in response.get("Contents", [])],
+            "next": token,
+        }
+
+        if not response.get("IsTruncated", False) or not token:
+            return
+
+
+def list_page(
+    bucket: str, prefix: str = "", token: str = "", page_size: int = 100
+):
+    """
+    Return a single folder-aware page of the bucket, see iter_objects
+    """
+
+    def load():
+        page = next(
+            iter_objects(bucket, prefix, "/", page_size, token),
+            {"folders": [], "objects": [], "next": ""},
+        )
+        return [page]
+
+    try:
+        return cached_listing(("objects", bucket, prefix, token, page_size), load)[0]
+
     except Exception as e:
         logger.error(e)
         raise e
 
 
 def list_bucket(bucket: str):
+    def load():
+        return [o for page in iter_objects(bucket) for o in page["objects"]]
+
     try:
-        client = get_client()
-        objects = client.list_objects(Bucket=bucket)
-        logger.debug(objects)
-        if "Contents" in objects:
-            return [
-                {
-                    "Object Key": o["Key"],
-                    "Size": o["Size"],
-                    "Modified": o["LastModified"],
-                }
-                for o in objects["Contents"]
-            ]
-        else:
-            return []
+        return cached_listing(("objects", bucket), load)
 
     except Exception as e:
         logger.error(e)
         raise e
 
 
+def iter_folder(bucket: str, prefix: str, start_after: str = ""):
+    """
+    Yield objects under the prefix in key order, only keys after `start_after` if given
+    """
+    client = get_client()
+    paginator = client.get_paginator("list_objects_v2")
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+
+    for page in paginator.paginate(**params):
+        for obj in page.get("Contents", []):
+            logger.debug(obj)
+            yield obj
+
+
+def scan_folder(bucket: str, prefix: str, start_after: str = ""):
+    """
+    Add up object sizes under the prefix, only for keys after `start_after` if given
+
+    :returns tuple(int, int, str): total size, object count and the last key seen
+    """
+    total_size = 0
+    object_count = 0
+    last_key = ""
+
+    for obj in iter_folder(bucket, prefix, start_after):
+        total_size += obj["Size"]
+        object_count += 1
+        last_key = obj["Key"]
+
+    return total_size, object_count, last_key
+
+
 def summarize_s3_folder(bucket, prefix):
+    """
+    Object count and total size under the prefix, updated incrementally
+
+    Keys written by NiFi are append-only and increase, so after the first full
+    scan only keys after the last one seen are listed. A full rescan runs every
+    SUMMARY_RESCAN_INTERVAL seconds; if keys up to the last one seen no longer add
+    up to what the incremental scans counted, objects were written out of order or
+    changed, and the prefix is treated as unordered and always fully scanned.
+    """
     try:
         if not prefix.endswith("/"):
             prefix += "/"
-        client = get_client()
-        paginator = client.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
 
-        total_size = 0
-        object_count = 0
+        now = timeit.default_timer()
+        with folder_summaries_lock:
+            state = dict(folder_summaries.get((bucket, prefix), {}))
 
-        for page in pages:
-            for obj in page.get("Contents", []):
+        if (
+            not state
+            or not state["ordered"]
+            or now - state["scanned_at"] > SUMMARY_RESCAN_INTERVAL
+        ):
+            total_size = 0
+            object_count = 0
+            last_key = ""
+            # keys appended since the last call are expected, only compare up to it
+            known_size = 0
+            known_count = 0
+            for obj in iter_folder(bucket, prefix):
                 total_size += obj["Size"]
                 object_count += 1
-                logger.debug(obj)
+                last_key = obj["Key"]
+                if state and obj["Key"] <= state["last_key"]:
+                    known_size += obj["Size"]
+                    known_count += 1
+
+            ordered = state.get("ordered", True)
+            if state and ordered and (known_size, known_count) != (
+                state["size"],
+                state["count"],
+            ):
+                logger.warning(
+                    "Keys under s3://%s/%s are not append-only, using full scans",
+                    bucket,
+                    prefix,
+                )
+                ordered = False
+            state = {
+                "size": total_size,
+                "count": object_count,
+                "last_key": last_key,
+                "scanned_at": now,
+                "ordered": ordered,
+            }
+        else:
+            total_size, object_count, last_key = scan_folder(
+                bucket, prefix, state["last_key"]
+            )
+            state["size"] += total_size
+            state["count"] += object_count
+            state["last_key"] = last_key or state["last_key"]
+
+        with folder_summaries_lock:
+            folder_summaries[(bucket, prefix)] = state
 
         return {
             "📁 Folder": f"s3://{bucket}/{prefix}",
-            "📦 Objects": str(object_count),
-            "🧮 Total size": f"{total_size / (1024**2):.2f} MB",
+            "📦 Objects": str(state["count"]),
+            "🧮 Total size": f"{state['size'] / (1024**2):.2f} MB",
         }
 
     except Exception as error:
         logger.error(error)
+
+
+FOOTER_READ_SIZE = 64 * 1024
+
+
+class RangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over an S3 object using ranged GETs
+
+    The last FOOTER_READ_SIZE bytes are fetched with the first request and kept,
+    so reading a Parquet footer usually costs a single GET.
+    """
+
+    def __init__(self, client, bucket_name: str, file_key: str):
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.file_key = file_key
+        self.position = 0
+        self.requests = 1
+
+        response = client.get_object(
+            Bucket=bucket_name, Key=file_key, Range=f"bytes=-{FOOTER_READ_SIZE}"
+        )
+        self.tail = response["Body"].read()
+        # Content-Range: bytes start-end/size
+        content_range = response.get("ContentRange", "")
+        self.size = (
+            int(content_range.rpartition("/")[2]) if content_range else len(self.tail)
+        )
+        self.tail_start = self.size - len(self.tail)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        return self.position
+
+    def read(self, size: int = -1):
+        end = self.size if size is None or size < 0 else min(self.position + size, self.size)
+        if end <= self.position:
+            return b""
+
+        if self.position >= self.tail_start:
+            data = self.tail[self.position - self.tail_start : end - self.tail_start]
+        else:
+            self.requests += 1
+            data = self.client.get_object(
+                Bucket=self.bucket_name,
+                Key=self.file_key,
+                Range=f"bytes={self.position}-{end - 1}",
+            )["Body"].read()
+
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def parquet_metadata(path: str):
+    """
+    Row counts, schema, row group sizes and column statistics from the Parquet footer only
+
+    :param path str: `s3://bucket/key` for objects, otherwise a local (POSIX) file path
+
+    :returns dict: file summary
+    """
+    import pyarrow.parquet as pq
+
+    if path.startswith("s3://"):
+        bucket_name, _, file_key = path[len("s3://") :].partition("/")
+        source = RangeFile(get_client(), bucket_name, file_key)
+    else:
+        source = open(path, "rb")
+
+    with source:
+        metadata = pq.ParquetFile(source).metadata
+
+    columns = {}
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        row_groups.append(
+            {"rows": row_group.num_rows, "bytes": row_group.total_byte_size}
+        )
+        for c in range(row_group.num_columns):
+            column = row_group.column(c)
+            stats = columns.setdefault(
+                column.path_in_schema, {"min": None, "max": None, "null_count": 0}
+            )
+            merge_statistics(stats, column.statistics)
+
+    return {
+        "path": path,
+        "rows": metadata.num_rows,
+        "row_groups": row_groups,
+        "schema": {
+            field.name: str(field.type) for field in metadata.schema.to_arrow_schema()
+        },
+        "columns": columns,
+    }
+
+
+def merge_statistics(stats: dict, other):
+    """
+    Fold min/max/null count from a row group (pyarrow Statistics) or another summary (dict) into stats
+    """
+    if other is None:
+        return
+
+    if isinstance(other, dict):
+        low, high, nulls = other["min"], other["max"], other["null_count"]
+    else:
+        low, high = (other.min, other.max) if other.has_min_max else (None, None)
+        nulls = other.null_count if other.has_null_count else 0
+
+    stats["null_count"] += nulls or 0
+    try:
+        if low is not None and (stats["min"] is None or low < stats["min"]):
+            stats["min"] = low
+        if high is not None and (stats["max"] is None or high > stats["max"]):
+            stats["max"] = high
+    except TypeError:
+        # mixed types across files, keep what we have
+        pass
+
+
+def parquet_prefix_stats(bucket_name: str, prefix: str = "", workers: int = 16):
+    """
+    Aggregate Parquet footers of every `.parquet` object under the prefix, read concurrently
+
+    :returns dict: file, row and byte totals, schema and merged column statistics
+    """
+    keys = [
+        o["Object Key"]
+        for page in iter_objects(bucket_name, prefix)
+        for o in page["objects"]
+        if o["Object Key"].endswith(".parquet")
+    ]
+
+    tick = timeit.default_timer()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files = list(
+            pool.map(parquet_metadata, [f"s3://{bucket_name}/{key}" for key in keys])
+        )
+
+    schema = {}
+    columns = {}
+    for f in files:
+        schema.update(f["schema"])
+        for name, stats in f["columns"].items():
+            merge_statistics(
+                columns.setdefault(name, {"min": None, "max": None, "null_count": 0}),
+                stats,
+            )
+
+    logger.info(
+        "Read %d parquet footers under s3://%s/%s in %.3f sec",
+        len(files),
+        bucket_name,
+        prefix,
+        timeit.default_timer() - tick,
+    )
+
+    return {
+        "files": len(files),
+        "rows": sum(f["rows"] for f in files),
+        "bytes": sum(rg["bytes"] for f in files for rg in f["row_groups"]),
+        "row_groups": sum(len(f["row_groups"]) for f in files),
+        "schema": schema,
+        "columns": columns,
+    }
@@ -0,0 +1,255 @@
+import asyncio
+import io
+import logging
+import os
+import weakref
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+
+import httpx
+import pandas as pd
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+import s3
+
+logger = logging.getLogger(__name__)
+
+REGION = "us-east-1"
+MAX_CONNECTIONS = s3.MAX_POOL_CONNECTIONS
+
+# httpx.AsyncClient is bound to the event loop it was created in
+clients = weakref.WeakKeyDictionary()
+credentials = {"mtime": None, "value": None}
+# Buckets seen or created by put, so uploads skip the existence check
+known_buckets = set()
+
+
+def get_credentials():
+    mtime = os.stat(s3.CREDENTIALS_FILE).st_mtime
+    if credentials["mtime"] != mtime:
+        credentials["value"] = Credentials(*s3.read_credentials())
+        credentials["mtime"] = mtime
+    return credentials["value"]
+
+
+def get_client():
+    """
+    Returns the AsyncClient for the running event loop, creating it on first use
+    """
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            verify=s3.CA_BUNDLE,
+            timeout=httpx.Timeout(60, connect=5),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS),
+        )
+        clients[loop] = client
+    return client
+
+
+async def request(
+    method: str,
+    bucket: str = "",
+    key: str = "",
+    params: dict = None,
+    body: bytes = b"",
+    headers: dict = None,
+):
+    """
+    Send a SigV4 signed path-style request to the S3 endpoint
+
+    :returns httpx.Response: response, raises for error status
+    """
+    url = s3.ENDPOINT_URL + "/"
+    if bucket:
+        url += bucket
+    if key:
+        url += "/" + quote(key, safe="/~")
+
+    aws_request = AWSRequest(
+        method=method, url=url, data=body, params=params or {}, headers=headers or {}
+    )
+    S3SigV4Auth(get_credentials(), "s3", REGION).add_auth(aws_request)
+    prepared = aws_request.prepare()
+
+    response = await get_client().request(
+        method, prepared.url, headers=dict(prepared.headers), content=body
+    )
+    response.raise_for_status()
+    return response
+
+
+def xml_items(content: bytes, tag: str):
+    """
+    Yield dicts of child texts for every `tag` element, ignoring XML namespaces
+    """
+    for element in ET.fromstring(content).iter():
+        if element.tag.rpartition("}")[2] == tag:
+            yield {child.tag.rpartition("}")[2]: child.text for child in element}
+
+
+def xml_value(content: bytes, tag: str):
+    for element in ET.fromstring(content):
+        if element.tag.rpartition("}")[2] == tag:
+            return element.text
+    return None
+
+
+async def list_buckets():
+    try:
+        response = await request("GET")
+        return [b["Name"] for b in xml_items(response.content, "Bucket")]
+
+    except Exception as e:
+        logger.error(e)
+        raise e
+
+
+async def iter_objects(bucket: str, prefix: str = "", page_size: int = 1000):
+    """
+    Async generator over list_objects_v2 pages, yielding object rows
+    """
+    token = ""
+    while True:
+        params = {"list-type": "2", "prefix": prefix, "max-keys": str(page_size)}
+        if token:
+            params["continuation-token"] = token
+
+        response = await request("GET", bucket, params=params)
+        for o in xml_items(response.content, "Contents"):
+            yield {
+                "Object Key": o["Key"],
+                "Size": int(o["Size"]),
+                "Modified": pd.Timestamp(o["LastModified"]),
+            }
+
+        token = xml_value(response.content, "NextContinuationToken")
+        if xml_value(response.content, "IsTruncated") != "true" or not token:
+            return
+
+
+async def list_bucket(bucket: str):
+    try:
+        return [o async for o in iter_objects(bucket)]
+
+    except Exception as e:
+        logger.error(e)
+        raise e
+
+
+async def summarize_s3_folder(bucket, prefix):
+    try:
+        if not prefix.endswith("/"):
+            prefix += "/"
+
+        total_size = 0
+        object_count = 0
+        async for o in iter_objects(bucket, prefix):
+            total_size += o["Size"]
+            object_count += 1
+
+        return {
+            "📁 Folder": f"s3://{bucket}/{prefix}",
+            "📦 Objects": str(object_count),
+            "🧮 Total size": f"{total_size / (1024**2):.2f} MB",
+        }
+
+    except Exception as error:
+        logger.error(error)
+
+
+async def head(bucket: str, key: str):
+    """
+    Object metadata, None if the object does not exist
+    """
+    try:
+        response = await request("HEAD", bucket, key)
+        return {
+            "Object Key": key,
+            "Size": int(response.headers.get("content-length", 0)),
+            "Modified": response.headers.get("last-modified"),
+            "ETag": response.headers.get("etag"),
+        }
+
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return None
+        logger.error(e)
+        raise e
+
+
+async def ensure_bucket(bucket_name: str):
+    # Create bucket if missing
+    if bucket_name in known_buckets:
+        return
+    if not bucket_name in await list_buckets():
+        try:
+            await request("PUT", bucket_name)
+            s3.invalidate_listing(bucket_name, buckets=True)
+        except Exception as e:
+            logger.error(e)
+            raise e
+    known_buckets.add(bucket_name)
+
+
+async def put(df: pd.DataFrame, bucket_name: str, file_key: str, content_type: str):
+    await ensure_bucket(bucket_name)
+
+    # encoding is CPU bound, keep it off the event loop
+    def encode():
+        buffer = io.BytesIO()
+        s3.write_dataframe(df, buffer, content_type)
+        return buffer.getvalue()
+
+    try:
+        body = await asyncio.to_thread(encode)
+        logger.info("Uploading file with key: %s", file_key)
+        await request(
+            "PUT",
+            bucket_name,
+            file_key,
+            body=body,
+            headers={"Content-Type": content_type},
+        )
+        s3.invalidate_listing(bucket_name)
+        logger.info("Successfully uploaded %s to bucket %s.", file_key, bucket_name)
+        return True
+
+    except Exception as e:
+        logger.error(e)
+        raise e
+
+
+async def bounded(coros, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros), return_exceptions=True)
+
+
+async def gather_puts(uploads, concurrency: int = 8):
+    """
+    Run put for every (df, bucket_name, file_key, content_type) with at most `concurrency` in flight
+
+    :returns list: True or the exception for each upload, in order
+    """
+    uploads = list(uploads)
+    for bucket_name in {upload[1] for upload in uploads}:
+        await ensure_bucket(bucket_name)
+
+    return await bounded([put(*upload) for upload in uploads], concurrency)
+
+
+async def gather_heads(bucket: str, keys, concurrency: int = 32):
+    """
+    Run head for every key in the bucket with at most `concurrency` in flight
+
+    :returns list: metadata dict, None or the exception for each key, in order
+    """
+    return await bounded([head(bucket, key) for key in keys], concurrency)
@@ -0,0 +1,181 @@
+"""
+S3 write-format benchmark
+
+Writes synthetic customer DataFrames in every format through each S3 write
+path and reports encode time, upload time, object size and peak RSS as JSON lines.
+Each case runs in a fresh process, so peak RSS belongs to that case alone.
+
+Run against a local S3 stand-in (moto server, MinIO) with:
+
+    S3_ENDPOINT_URL=http://localhost:5000 S3_CREDENTIALS_FILE=./credentials S3_CA_BUNDLE= \\
+        python s3_bench.py --rows 10000 1000000 --output results.jsonl
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+import s3
+
+FORMATS = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "parquet": "application/octet-stream",
+}
+
+
+class CountingWriter(io.RawIOBase):
+    """
+    Discards everything written, counting bytes
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.position += len(data)
+        return len(data)
+
+
+def customers(rows: int, pool_size: int = 1000, seed: int = 0):
+    """
+    Synthetic customers with the utils.fake_customer schema
+
+    A pool of Faker records is sampled with replacement, so generating 10M rows
+    does not cost 10M Faker calls. Every row gets a unique _id.
+    """
+    import utils
+
+    pool = pd.DataFrame([utils.fake_customer() for _ in range(min(pool_size, rows))])
+    pool["current_location"] = pool["current_location"].astype(str)
+    pool["birthdate"] = pd.to_datetime(pool["birthdate"])
+
+    rng = np.random.default_rng(seed)
+    df = pool.iloc[rng.integers(0, len(pool), rows)].reset_index(drop=True)
+    df["_id"] = [f"{i:032x}" for i in range(rows)]
+    return df
+
+
+def put_object(df: pd.DataFrame, bucket: str, key: str, content_type: str):
+    """
+    Encode into one buffer and send with a single put_object, as s3.put did originally
+    """
+    buffer = io.BytesIO()
+    s3.write_dataframe(df, buffer, content_type)
+    s3.ensure_bucket(bucket)
+    s3.get_client().put_object(
+        Bucket=bucket, Key=key, Body=buffer.getvalue(), ContentType=content_type
+    )
+
+
+def put_dataset(df: pd.DataFrame, bucket: str, key: str, content_type: str):
+    s3.put_dataset(df, bucket, key.rpartition(".")[0])
+
+
+def async_put(df: pd.DataFrame, bucket: str, key: str, content_type: str):
+    import s3_async
+
+    asyncio.run(s3_async.put(df, bucket, key, content_type))
+
+
+# name: (function(df, bucket, key, content_type), formats it supports)
+PATHS = {
+    "put_object": (put_object, list(FORMATS)),
+    "put": (s3.put, list(FORMATS)),
+    "put_dataset": (put_dataset, ["parquet"]),
+    "async_put": (async_put, list(FORMATS)),
+}
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+def run_case(rows: int, fmt: str, path: str, bucket: str):
+    """
+    Generate the data, then time encoding alone and the full write through the path
+    """
+    df = customers(rows)
+    data_rss_mb = current_rss_mb()
+    content_type = FORMATS[fmt]
+
+    tick = timeit.default_timer()
+    counter = CountingWriter()
+    s3.write_dataframe(df, counter, content_type)
+    encode_secs = timeit.default_timer() - tick
+
+    key = f"bench/{path}/{rows}.{fmt}"
+    write, _ = PATHS[path]
+    tick = timeit.default_timer()
+    write(df, bucket, key, content_type)
+    write_secs = timeit.default_timer() - tick
+
+    return {
+        "rows": rows,
+        "format": fmt,
+        "path": path,
+        "bytes": counter.tell(),
+        "encode_secs": round(encode_secs, 3),
+        "write_secs": round(write_secs, 3),
+        "upload_secs": round(max(write_secs - encode_secs, 0), 3),
+        "mb_per_sec": round(counter.tell() / 1024**2 / write_secs, 2) if write_secs else 0,
+        "data_rss_mb": round(data_rss_mb, 1),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run(rows=(10_000, 1_000_000, 10_000_000), formats=None, paths=None, bucket="bench"):
+    """
+    Run every (rows, format, path) combination, each in its own process
+
+    :returns generator[dict]: one result per case
+    """
+    for count in rows:
+        for fmt in formats or FORMATS:
+            for path in paths or PATHS:
+                if fmt not in PATHS[path][1]:
+                    continue
+                with ProcessPoolExecutor(
+                    max_workers=1, mp_context=get_context("spawn")
+                ) as pool:
+                    try:
+                        yield pool.submit(run_case, count, fmt, path, bucket).result()
+                    except Exception as error:
+                        yield {"rows": count, "format": fmt, "path": path, "error": str(error)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS))
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS))
+    parser.add_argument("--bucket", default="bench")
+    parser.add_argument("--output", help="append JSON lines to this file")
+    args = parser.parse_args()
+
+    for result in run(args.rows, args.formats, args.paths, args.bucket):
+        line = json.dumps(result)
+        print(line, flush=True)
+        if args.output:
+            with open(args.output, "a") as out:
+                out.write(line + "\n")
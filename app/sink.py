@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import threading
+import timeit
+
+import pyarrow as pa
+
+from config import logger
+import constants
+import streams
+import tables
+
+# Throughput and lag per table path, updated after every written batch
+metrics = {}
+
+
+def with_ids(table: pa.Table):
+    """
+    Add a deterministic `_id` derived from the row content, so redelivered messages overwrite themselves
+    """
+    if "_id" in table.column_names:
+        return table
+
+    ids = [
+        hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()
+        for row in table.to_pylist()
+    ]
+    return table.append_column("_id", pa.array(ids))
+
+
+def resume(batches, ack: bool):
+    try:
+        return batches.send(ack)
+    except StopIteration:
+        return None
+
+
+async def write_batch(
+    table_path: str,
+    batch: list,
+    target: str = "json",
+    writer: tables.DeltaWriter = None,
+):
+    """
+    Decode a batch of stream messages and upsert it into a JSON or Delta table
+
+    :param writer tables.DeltaWriter: buffer Delta writes in this writer, merge right away if None
+
+    :return bool: result of write
+    """
+    table = with_ids(streams.decode_batch(batch))
+
+    if target == "delta":
+        if writer is not None:
+            return await writer.add(table.to_pandas())
+        return await tables.delta_table_upsert(table_path, table.to_pandas())
+
+    return await tables.upsert_documents(table_path, table.to_pylist())
+
+
+async def stream_to_table(
+    table_path: str,
+    target: str = "json",
+    stream: str = constants.DEMO_STREAM,
+    topic: str = "incoming",
+    consumer_group: str = "table-sink",
+    batch_size: int = 1000,
+    linger: float = 1.0,
+    max_wait: float = None,
+    until_eof: bool = False,
+    stop: threading.Event = None,
+    delta_buffer_rows: int = tables.DELTA_BUFFER_ROWS,
+    delta_buffer_secs: float = tables.DELTA_BUFFER_SECS,
+    zorder: bool = False,
+):
+    """
+    Continuously write messages from the topic into a table in micro-batches
+
+    Consumer offsets are committed only after a batch is written, a failed write
+    stops the sink so those messages are read again on the next run.
+
+    Delta writes go through a tables.DeltaWriter, so batches are merged together
+    and the table is compacted and vacuumed in the background. Offsets for
+    buffered batches are committed with the first batch after the merge, messages
+    still buffered when the sink stops are merged but read again on the next run.
+
+    :param table_path str: JSON table path, or Delta table path under the mount for target="delta"
+    :param target str: "json" for OJAI document table, "delta" for Delta Lake table
+    :param batch_size int: max messages per write
+    :param linger float: seconds to wait filling a batch before writing it
+    :param max_wait float: stop after this many seconds, None to run until stopped
+    :param until_eof bool: stop once the topic is drained
+    :param stop threading.Event: set to stop the sink
+    :param delta_buffer_rows int: merge into the Delta table once this many rows are buffered
+    :param delta_buffer_secs float: merge into the Delta table once the oldest buffered row is this old
+    :param zorder bool: Z-order the Delta table on `_id` when compacting
+
+    :returns dict: metrics for the table
+    """
+    lag = {}
+    stats = metrics.setdefault(
+        table_path,
+        {"batches": 0, "messages": 0, "failed_batches": 0, "messages_per_sec": 0},
+    )
+    stats["lag"] = lag
+
+    writer = None
+    if target == "delta":
+        writer = tables.DeltaWriter(
+            table_path,
+            max_rows=delta_buffer_rows,
+            max_secs=delta_buffer_secs,
+            zorder=zorder,
+        ).start()
+        stats["delta"] = writer.metrics
+
+    batches = streams.consume_batches(
+        stream,
+        topic,
+        consumer_group=consumer_group,
+        batch_size=batch_size,
+        max_wait=max_wait,
+        linger=linger,
+        until_eof=until_eof,
+        lag=lag,
+        stop=stop,
+        with_codec=True,
+    )
+
+    ack = None
+    try:
+        while True:
+            batch = await asyncio.to_thread(resume, batches, ack)
+            if batch is None:
+                break
+
+            tick = timeit.default_timer()
+            if not await write_batch(table_path, batch, target, writer):
+                stats["failed_batches"] += 1
+                logger.error(
+                    "Failed to write %d messages to %s, offsets not committed",
+                    len(batch),
+                    table_path,
+                )
+                break
+            elapsed = timeit.default_timer() - tick
+            # hold the commit until every batch so far is merged
+            ack = writer is None or writer.merged()
+
+            stats["batches"] += 1
+            stats["messages"] += len(batch)
+            stats["messages_per_sec"] = len(batch) / elapsed if elapsed else 0
+
+            logger.info(
+                "Sink wrote %d messages to %s in %.3f sec (%.0f msg/sec), lag: %d",
+                len(batch),
+                table_path,
+                elapsed,
+                stats["messages_per_sec"],
+                sum(lag.values()),
+            )
+
+    finally:
+        # closing before the next resume skips the commit for an unwritten batch
+        await asyncio.to_thread(batches.close)
+        if writer is not None:
+            await writer.close()
+
+    return stats
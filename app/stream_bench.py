@@ -0,0 +1,146 @@
+"""
+Stream load generator and end-to-end latency benchmark
+
+Produces stamped messages from a precomputed payload pool and consumes them
+back on a separate thread, reporting throughput and produce-to-consume latency.
+
+Run against a local Kafka broker with:
+
+    KAFKA_BOOTSTRAP_SERVERS=localhost:9092 python stream_bench.py --count 100000
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+import timeit
+from uuid import uuid4
+
+from faker import Faker
+
+import constants
+import streams
+
+logger = logging.getLogger(__name__)
+
+
+def payload_pool(size: int = 1000):
+    """
+    Pre-render sample profiles as JSON objects without the opening brace,
+    so stamping a message is a single string concatenation
+    """
+    fake = Faker(["en_GB"])
+    return [
+        json.dumps(fake.profile(fields=["name", "address", "job", "sex"]))[1:]
+        for _ in range(size)
+    ]
+
+
+def stamped(pool: list, count: int, rate: float = None):
+    """
+    Yield `count` messages with their send time, paced at `rate` msg/sec if given
+    """
+    start = timeit.default_timer()
+    for i in range(count):
+        if rate:
+            delay = start + i / rate - timeit.default_timer()
+            if delay > 0:
+                time.sleep(delay)
+        yield f'{{"sent_at": {time.time()}, {pool[i % len(pool)]}'
+
+
+def collect(stream: str, topic: str, count: int, max_wait: float, latencies: list):
+    """
+    Consume until `count` messages arrive, recording latency per message
+    """
+    for batch in streams.consume_batches(
+        stream,
+        topic,
+        consumer_group=f"bench-{topic}",
+        max_messages=count,
+        max_wait=max_wait,
+        until_eof=False,
+    ):
+        received_at = time.time()
+        sent = streams.decode_batch(batch).column("sent_at").to_pylist()
+        latencies.extend(received_at - s for s in sent)
+
+
+def run(
+    stream: str = constants.DEMO_STREAM,
+    topic: str = "",
+    count: int = 100_000,
+    rate: float = None,
+    pool_size: int = 1000,
+    max_wait: float = 120,
+):
+    """
+    Run one benchmark round
+
+    :param stream str: stream path
+    :param topic str: topic to use, defaults to a new topic per run
+    :param count int: number of messages to send
+    :param rate float: target msg/sec, None for flat out
+    :param pool_size int: number of distinct payloads to cycle through
+    :param max_wait float: give up consuming after this many seconds
+
+    :returns dict: throughput and latency results
+    """
+    topic = topic or f"bench-{uuid4().hex[:8]}"
+    pool = payload_pool(pool_size)
+
+    latencies = []
+    consumer = threading.Thread(
+        target=collect, args=(stream, topic, count, max_wait, latencies)
+    )
+
+    tick = timeit.default_timer()
+    consumer.start()
+    sent = streams.produce_many(stream, topic, stamped(pool, count, rate))
+    produce_secs = timeit.default_timer() - tick
+    consumer.join()
+    total_secs = timeit.default_timer() - tick
+
+    return {
+        "stream": stream,
+        "topic": topic,
+        "target_rate": rate,
+        "sent": sent,
+        "received": len(latencies),
+        "produce_secs": round(produce_secs, 3),
+        "total_secs": round(total_secs, 3),
+        "produce_msg_per_sec": round(sent / produce_secs if produce_secs else 0),
+        "end_to_end_msg_per_sec": round(len(latencies) / total_secs if total_secs else 0),
+        "latency_ms": {
+            f"p{pct}": round(streams.percentile(latencies, pct) * 1000, 2)
+            for pct in (50, 95, 99)
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stream", default=constants.DEMO_STREAM)
+    parser.add_argument("--topic", default="", help="defaults to a new topic per run")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--rate", type=float, default=None, help="msg/sec, default flat out")
+    parser.add_argument("--pool-size", type=int, default=1000)
+    parser.add_argument("--max-wait", type=float, default=120)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    print(
+        json.dumps(
+            run(
+                stream=args.stream,
+                topic=args.topic,
+                count=args.count,
+                rate=args.rate,
+                pool_size=args.pool_size,
+                max_wait=args.max_wait,
+            ),
+            indent=2,
+        )
+    )
@@ -1,16 +1,129 @@
+import asyncio
 import logging
+import math
+import os
+import threading
+import timeit
 
 logger = logging.getLogger(__name__)
 
-def produce(stream: str, topic: str, message: str):
+# Message header naming the payload encoding, see encode/decode
+CODEC_HEADER = "codec"
+CODECS = ["json", "msgpack", "arrow"]
+
+# Set to use a plain Kafka broker (e.g. a local stand-in) instead of Data Fabric streams
+KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "")
+
+# Producers are expensive to set up, keep one per stream for the process lifetime
+producers = {}
+producers_lock = threading.Lock()
+# Background delivery report pollers used by the async producer, per stream
+pollers = {}
+pollers_lock = threading.Lock()
+
+
+def broker_config(stream: str = ""):
+    """
+    Client settings to reach the stream, or the Kafka broker if one is configured
+    """
+    if KAFKA_BOOTSTRAP_SERVERS:
+        return {"bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS}
+    if stream:
+        return {"streams.producer.default.stream": stream}
+    return {}
+
+
+def stream_topic(stream: str, topic: str):
+    """
+    Full topic name to subscribe to, Kafka brokers have no stream path
+    """
+    return topic if KAFKA_BOOTSTRAP_SERVERS else f"{stream}:{topic}"
+
+
+def get_producer(stream: str):
+    """
+    Returns a cached Producer for the stream, creating it on first use
+    """
     from confluent_kafka import Producer
 
+    with producers_lock:
+        producer = producers.get(stream)
+        if producer is None:
+            logger.debug("New producer for stream: %s", stream)
+            producer = Producer(broker_config(stream))
+            producers[stream] = producer
+
+    return producer
+
+
+def serve_deliveries(producer, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            producer.poll(0.1)
+        except Exception as error:
+            # raised from a delivery callback, keep serving the others
+            logger.warning("Delivery report failed: %s", error)
+
+
+def get_polled_producer(stream: str):
+    """
+    Returns the cached Producer for the stream, with a background thread serving its delivery reports
+    """
+    producer = get_producer(stream)
+
+    with pollers_lock:
+        if stream in pollers and not pollers[stream][0].is_alive():
+            logger.warning("Delivery poller for %s stopped, restarting", stream)
+            del pollers[stream]
+        if stream not in pollers:
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=serve_deliveries,
+                args=(producer, stop),
+                name=f"poll-{stream}",
+                daemon=True,
+            )
+            thread.start()
+            pollers[stream] = (thread, stop)
+
+    return producer
+
+
+def close_producers():
+    """
+    Stop delivery pollers, flush and drop all cached producers
+    """
+    with pollers_lock:
+        for thread, stop in pollers.values():
+            stop.set()
+            thread.join()
+        pollers.clear()
+
+    with producers_lock:
+        for stream, producer in producers.items():
+            logger.debug("Flushing producer for stream: %s", stream)
+            producer.flush()
+        producers.clear()
+
+
+def percentile(values: list, pct: float):
+    """
+    Nearest-rank percentile of a list of numbers, 0 if empty
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def produce(stream: str, topic: str, message: str, key: str = None):
     logger.debug("Stream path: %s", stream)
-    p = Producer({"streams.producer.default.stream": stream})
+    p = get_producer(stream)
 
     try:
         # logger.info("sending message: %s", message)
-        p.produce(topic, message.encode("utf-8"))
+        p.produce(topic, message.encode("utf-8"), key=key)
         logger.info('sent message: %s', message)
 
     except Exception as error:
@@ -23,6 +136,251 @@ def produce(stream: str, topic: str, message: str):
     return True
 
 
+def produce_many(stream: str, topic: str, messages, on_delivery=None, headers=None):
+    """
+    Queue all messages on the cached producer and flush once
+
+    :param stream str: stream path
+    :param topic str: topic name in the stream
+    :param messages iterable[str | tuple]: messages to send, or (key, message) tuples
+    :param on_delivery callable: optional callback(error, message) per delivery report
+    :param headers list[tuple]: optional headers added to every message
+
+    :return int: number of messages delivered
+    """
+    p = get_producer(stream)
+    latencies = []
+    failed = []
+
+    def delivered(sent_at):
+        def report(error, message):
+            latencies.append(timeit.default_timer() - sent_at)
+            if error is not None:
+                failed.append(error)
+            if on_delivery is not None:
+                on_delivery(error, message)
+
+        return report
+
+    tick = timeit.default_timer()
+    queued = 0
+
+    for message in messages:
+        key = None
+        if isinstance(message, tuple):
+            key, message = message
+        payload = message.encode("utf-8") if isinstance(message, str) else message
+        while True:
+            try:
+                p.produce(
+                    topic,
+                    payload,
+                    key=key,
+                    headers=headers,
+                    callback=delivered(timeit.default_timer()),
+                )
+                break
+            except BufferError:
+                # local queue is full, serve delivery reports to make room
+                p.poll(0.1)
+        queued += 1
+        p.poll(0)
+
+    p.flush()
+
+    elapsed = timeit.default_timer() - tick
+    sent = queued - len(failed)
+    for error in set(str(e) for e in failed):
+        logger.warning(error)
+
+    logger.info(
+        "Sent %d/%d messages to %s:%s in %.3f sec (%.0f msg/sec, p99 delivery %.1f ms)",
+        sent,
+        queued,
+        stream,
+        topic,
+        elapsed,
+        queued / elapsed if elapsed else 0,
+        percentile(latencies, 99) * 1000,
+    )
+
+    return sent
+
+
+def delivery_future(loop):
+    """
+    Returns an asyncio future and a delivery callback that settles it from the poller thread
+    """
+    from confluent_kafka import KafkaException
+
+    future = loop.create_future()
+
+    def settle(error, message):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(KafkaException(error))
+        else:
+            future.set_result(message)
+
+    def report(error, message):
+        # the awaiting loop may be gone, ie the task was cancelled and asyncio.run returned
+        if loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(settle, error, message)
+        except RuntimeError:
+            pass
+
+    return future, report
+
+
+async def aproduce(stream: str, topic: str, message: str, key: str = None):
+    """
+    Publish a message without blocking the event loop, await its delivery
+
+    :return bool: result of delivery
+    """
+    loop = asyncio.get_running_loop()
+    p = get_polled_producer(stream)
+    future, report = delivery_future(loop)
+
+    try:
+        while True:
+            try:
+                p.produce(topic, message.encode("utf-8"), key=key, callback=report)
+                break
+            except BufferError:
+                await asyncio.sleep(0.1)
+
+        await future
+        logger.info("sent message: %s", message)
+
+    except Exception as error:
+        logger.warning(error)
+        return False
+
+    return True
+
+
+async def aproduce_many(stream: str, topic: str, messages):
+    """
+    Queue all messages without blocking the event loop, await all deliveries
+
+    :param messages iterable[str | tuple]: messages to send, or (key, message) tuples
+
+    :return int: number of messages delivered
+    """
+    loop = asyncio.get_running_loop()
+    p = get_polled_producer(stream)
+
+    tick = timeit.default_timer()
+    futures = []
+    # refused by produce, then failed deliveries
+    errors = []
+
+    for message in messages:
+        key = None
+        if isinstance(message, tuple):
+            key, message = message
+        future, report = delivery_future(loop)
+        try:
+            payload = message.encode("utf-8") if isinstance(message, str) else message
+            while True:
+                try:
+                    p.produce(topic, payload, key=key, callback=report)
+                    break
+                except BufferError:
+                    await asyncio.sleep(0.1)
+        except Exception as error:
+            future.cancel()
+            errors.append(error)
+            continue
+        futures.append(future)
+
+    results = await asyncio.gather(*futures, return_exceptions=True)
+
+    elapsed = timeit.default_timer() - tick
+    total = len(futures) + len(errors)
+    errors += [r for r in results if isinstance(r, Exception)]
+    sent = total - len(errors)
+    for error in set(str(e) for e in errors):
+        logger.warning(error)
+
+    logger.info(
+        "Sent %d/%d messages to %s:%s in %.3f sec (%.0f msg/sec)",
+        sent,
+        total,
+        stream,
+        topic,
+        elapsed,
+        total / elapsed if elapsed else 0,
+    )
+
+    return sent
+
+
+def encode(rows: list, codec: str = "json", rows_per_message: int = 10_000):
+    """
+    Encode rows into message values
+
+    json and msgpack give one message per row, arrow packs up to
+    `rows_per_message` rows into a single IPC record batch message.
+
+    :param rows list[dict]: rows to encode
+    :param codec str: one of CODECS
+
+    :returns list[bytes]: message values
+    """
+    if codec == "json":
+        import json
+
+        return [json.dumps(row).encode("utf-8") for row in rows]
+    elif codec == "msgpack":
+        import msgpack
+
+        return [msgpack.packb(row) for row in rows]
+    elif codec == "arrow":
+        import pyarrow as pa
+
+        values = []
+        for start in range(0, len(rows), rows_per_message):
+            table = pa.Table.from_pylist(rows[start : start + rows_per_message])
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            values.append(sink.getvalue().to_pybytes())
+        return values
+    else:
+        raise ValueError(f"Unsupported codec: {codec}")
+
+
+def message_codec(message):
+    """
+    Codec recorded in the message header, messages without one are json
+    """
+    for key, value in message.headers() or []:
+        if key == CODEC_HEADER:
+            return value.decode("utf-8")
+    return "json"
+
+
+def produce_rows(
+    stream: str, topic: str, rows: list, codec: str = "json", rows_per_message: int = 10_000
+):
+    """
+    Encode rows with the codec and publish them, tagging messages with the codec header
+
+    Plain json is sent without a header so existing consumers keep working.
+
+    :return int: number of messages delivered
+    """
+    headers = None if codec == "json" else [(CODEC_HEADER, codec.encode("utf-8"))]
+    return produce_many(
+        stream, topic, encode(rows, codec, rows_per_message), headers=headers
+    )
+
+
 def consume(stream: str, topic: str, consumer_group: str = 'demo-consumer'):
     from confluent_kafka import Consumer, KafkaError
     MAX_POLL_TIME = 2
@@ -30,12 +388,12 @@ def consume(stream: str, topic: str, consumer_group: str = 'demo-consumer'):
     logger.info("Consuming from Stream: %s Topic: %s", stream, topic)
 
     consumer = Consumer(
-        {"group.id": consumer_group, "default.topic.config": {"auto.offset.reset": "earliest"}}
+        {"group.id": consumer_group, "default.topic.config": {"auto.offset.reset": "earliest"}, **broker_config()}
     )
 
     try:
 
-        consumer.subscribe([f"{stream}:{topic}"])
+        consumer.subscribe([stream_topic(stream, topic)])
 
         while True:
             message = consumer.poll(timeout=MAX_POLL_TIME)
@@ -57,3 +415,347 @@ def consume(stream: str, topic: str, consumer_group: str = 'demo-consumer'):
     finally:
         consumer.close()
 
+
+def consume_batches(
+    stream: str,
+    topic: str,
+    consumer_group: str = "demo-consumer",
+    batch_size: int = 500,
+    max_messages: int = None,
+    max_wait: float = 10,
+    offsets: dict = None,
+    linger: float = 0,
+    until_eof: bool = True,
+    lag: dict = None,
+    stop: threading.Event = None,
+    with_codec: bool = False,
+):
+    """
+    Drain the topic in batches, yielding lists of raw message payloads
+
+    Offsets are committed once the caller resumes the generator after a batch,
+    so a batch abandoned half-way through is delivered again on the next run.
+    Resume with send(False) to hold the commit back, ie while the batch is only
+    buffered downstream, the next commit covers it.
+
+    :param stream str: stream path
+    :param topic str: topic name in the stream
+    :param consumer_group str: consumer group id
+    :param batch_size int: max number of messages in a batch
+    :param max_messages int: stop after this many messages, None for no limit
+    :param max_wait float: stop after this many seconds in total, None for no limit
+    :param offsets dict: if given, updated with the next offset per partition
+    :param linger float: seconds to keep filling a batch before yielding it
+    :param until_eof bool: stop once all assigned partitions are drained
+    :param lag dict: if given, updated with messages left per partition after each batch
+    :param stop threading.Event: if given, stop consuming once it is set
+    :param with_codec bool: yield (codec, value) tuples, codec read from the message header
+
+    :returns generator[list[bytes]]: batches of message values
+    """
+    from confluent_kafka import Consumer, KafkaError, TopicPartition
+
+    MAX_POLL_TIME = 1
+
+    logger.info("Consuming batches from Stream: %s Topic: %s", stream, topic)
+
+    consumer = Consumer(
+        {
+            "group.id": consumer_group,
+            "enable.auto.commit": False,
+            "enable.partition.eof": True,
+            "default.topic.config": {"auto.offset.reset": "earliest"},
+            **broker_config(),
+        }
+    )
+
+    received = 0
+    tick = timeit.default_timer()
+
+    def time_left():
+        if max_wait is None:
+            return MAX_POLL_TIME
+        return max_wait - (timeit.default_timer() - tick)
+
+    try:
+        consumer.subscribe([stream_topic(stream, topic)])
+
+        eof_partitions = set()
+        next_offsets = {}
+        while True:
+            if time_left() <= 0:
+                logger.info("Reached max wait of %s sec", max_wait)
+                break
+
+            if stop is not None and stop.is_set():
+                logger.info("Consumer stopped for %s:%s", stream, topic)
+                break
+
+            want = batch_size
+            if max_messages is not None:
+                want = min(batch_size, max_messages - received)
+
+            batch = []
+            idle = False
+            linger_until = timeit.default_timer() + linger
+            while len(batch) < want:
+                messages = consumer.consume(
+                    num_messages=want - len(batch),
+                    timeout=max(min(MAX_POLL_TIME, time_left()), 0),
+                )
+                idle = not messages
+
+                for message in messages:
+                    if not message.error():
+                        batch.append(
+                            (message_codec(message), message.value())
+                            if with_codec
+                            else message.value()
+                        )
+                        eof_partitions.discard(message.partition())
+                        next_offsets[message.partition()] = message.offset() + 1
+                    elif message.error().code() == KafkaError._PARTITION_EOF:
+                        eof_partitions.add(message.partition())
+                    # silently ignore other errors
+                    else:
+                        logger.warning(message.error())
+
+                if (
+                    idle
+                    or (until_eof and eof_partitions)
+                    or time_left() <= 0
+                    or timeit.default_timer() >= linger_until
+                ):
+                    break
+
+            if offsets is not None:
+                offsets.update(next_offsets)
+
+            if batch and lag is not None:
+                for partition, offset in next_offsets.items():
+                    try:
+                        _, high = consumer.get_watermark_offsets(
+                            TopicPartition(stream_topic(stream, topic), partition)
+                        )
+                        lag[partition] = max(high - offset, 0)
+                    except Exception as error:
+                        logger.debug("No watermark for partition %d: %s", partition, error)
+
+            if batch:
+                received += len(batch)
+                ack = yield batch
+                if ack is not False:
+                    consumer.commit(asynchronous=False)
+
+            if max_messages is not None and received >= max_messages:
+                break
+
+            if not until_eof:
+                continue
+
+            assigned = consumer.assignment()
+            if eof_partitions and len(eof_partitions) >= len(assigned):
+                logger.info("No more messages in topic: %s", topic)
+                break
+
+            if idle and assigned:
+                break
+
+    except Exception as error:
+        logger.warning(error)
+
+    finally:
+        consumer.close()
+        elapsed = timeit.default_timer() - tick
+        logger.info(
+            "Consumed %d messages from %s:%s in %.3f sec",
+            received,
+            stream,
+            topic,
+            elapsed,
+        )
+
+
+def decode_json(values: list):
+    """
+    Decode NDJSON payloads into an Arrow table in one pass
+
+    Falls back to per-message json parsing if the vectorized reader rejects the batch.
+    """
+    import json
+    import pyarrow as pa
+    from pyarrow import json as pajson
+
+    buffer = b"\n".join(
+        msg.encode("utf-8") if isinstance(msg, str) else msg for msg in values
+    )
+
+    try:
+        return pajson.read_json(pa.BufferReader(buffer))
+
+    except pa.ArrowInvalid as error:
+        logger.debug("Vectorized decode failed, falling back: %s", error)
+        return pa.Table.from_pylist([json.loads(msg) for msg in values])
+
+
+def decode_msgpack(values: list):
+    """
+    Unpack msgpack message values and build one Arrow table from all of them
+    """
+    import msgpack
+    import pyarrow as pa
+
+    rows = pa.array([msgpack.unpackb(value) for value in values])
+    if not pa.types.is_struct(rows.type):
+        # no fields at all, ie only empty maps
+        return pa.table({})
+    # converting one struct array is much faster than Table.from_pylist
+    return pa.Table.from_struct_array(rows)
+
+
+def decode(value: bytes, codec: str = "json"):
+    """
+    Decode a single message value into an Arrow table
+
+    :param value bytes: message value
+    :param codec str: one of CODECS
+
+    :returns pyarrow.Table: decoded rows
+    """
+    import pyarrow as pa
+
+    if codec == "json":
+        return decode_json([value])
+    elif codec == "msgpack":
+        return decode_msgpack([value])
+    elif codec == "arrow":
+        return pa.ipc.open_stream(pa.py_buffer(value)).read_all()
+    else:
+        raise ValueError(f"Unsupported codec: {codec}")
+
+
+def decode_batch(batch: list):
+    """
+    Decode a batch of payloads into an Arrow table, column by column
+
+    JSON and msgpack payloads are each decoded together into one table, arrow
+    messages already hold a record batch each.
+    Rows are grouped by codec, so order is kept only within the same codec.
+
+    :param batch list[bytes | tuple]: raw message values, or (codec, value) tuples
+
+    :returns pyarrow.Table: decoded rows
+    """
+    import pyarrow as pa
+
+    if not batch:
+        return pa.table({})
+
+    json_values = []
+    msgpack_values = []
+    tables = []
+    for item in batch:
+        codec, value = item if isinstance(item, tuple) else ("json", item)
+        if codec == "json":
+            json_values.append(value)
+        elif codec == "msgpack":
+            msgpack_values.append(value)
+        else:
+            tables.append(decode(value, codec))
+
+    if msgpack_values:
+        tables.insert(0, decode_msgpack(msgpack_values))
+    if json_values:
+        tables.insert(0, decode_json(json_values))
+
+    if len(tables) == 1:
+        return tables[0]
+
+    return pa.concat_tables(tables, promote_options="default")
+
+
+def consume_dataframe(stream: str, topic: str, **kwargs):
+    """
+    Drain the topic with consume_batches and decode it column by column
+
+    :param stream str: stream path
+    :param topic str: topic name in the stream
+    :param kwargs: passed to consume_batches
+
+    :returns pd.DataFrame: all consumed messages
+    """
+    import pyarrow as pa
+
+    tables = [
+        decode_batch(batch)
+        for batch in consume_batches(stream, topic, with_codec=True, **kwargs)
+    ]
+
+    if not tables:
+        return pa.table({}).to_pandas()
+
+    return pa.concat_tables(tables, promote_options="default").to_pandas()
+
+
+def consume_parallel(
+    stream: str,
+    topic: str,
+    workers: int = 4,
+    consumer_group: str = "demo-consumer",
+    **kwargs,
+):
+    """
+    Drain the topic with several consumers in the same group
+
+    Each worker thread gets its own consumer, so the group spreads the topic
+    partitions across them. Decoded batches are merged into one DataFrame.
+
+    :param stream str: stream path
+    :param topic str: topic name in the stream
+    :param workers int: number of consumers to start
+    :param consumer_group str: consumer group id shared by all workers
+    :param kwargs: passed to consume_batches
+
+    :returns tuple(pd.DataFrame, dict): all consumed messages and next offset per partition
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import pyarrow as pa
+
+    def worker(_):
+        offsets = {}
+        tables = [
+            decode_batch(batch)
+            for batch in consume_batches(
+                stream,
+                topic,
+                consumer_group=consumer_group,
+                offsets=offsets,
+                with_codec=True,
+                **kwargs,
+            )
+        ]
+        return tables, offsets
+
+    tick = timeit.default_timer()
+
+    tables = []
+    offsets = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for worker_tables, worker_offsets in pool.map(worker, range(workers)):
+            tables.extend(worker_tables)
+            for partition, offset in worker_offsets.items():
+                offsets[partition] = max(offset, offsets.get(partition, 0))
+
+    logger.info(
+        "%d consumers read %d partitions from %s:%s in %.3f sec",
+        workers,
+        len(offsets),
+        stream,
+        topic,
+        timeit.default_timer() - tick,
+    )
+
+    if not tables:
+        return pa.table({}).to_pandas(), offsets
+
+    return pa.concat_tables(tables, promote_options="default").to_pandas(), offsets
@@ -1,8 +1,18 @@
+import asyncio
+import json
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from constants import CLUSTER_NAME, MOUNT_PATH
 from mapr.ojai.storage.ConnectionFactory import ConnectionFactory
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from deltalake import DeltaTable, write_deltalake
 
 import timeit
@@ -14,34 +24,221 @@ import utils
 # suppress ojai connection logging
 logging.getLogger("mapr.ojai.storage.OJAIConnection").setLevel(logging.NOTSET)
 
-ojaiconnection = None
-
-
-def get_connection():
+# Connections shared by all sessions and bulk loader threads
+POOL_SIZE = int(os.environ.get("OJAI_POOL_SIZE", 8))
+POOL_TIMEOUT = 30
+# Idle connections older than this are checked before being handed out
+HEALTH_CHECK_INTERVAL = 60
+HEALTH_CHECK_PATH = "/apps"
+# Store handles kept per connection
+STORE_CACHE_SIZE = 32
+connection_pool = None
+connection_pool_lock = threading.Lock()
+
+BULK_WORKERS = 4
+bulk_pool = None
+
+# DeltaWriter merges once this many rows are buffered, or the oldest is this old
+DELTA_BUFFER_ROWS = 50_000
+DELTA_BUFFER_SECS = 30
+# Compact, checkpoint and vacuum interval for DeltaWriter
+DELTA_MAINTENANCE_INTERVAL = 15 * 60
+
+# Arrow tables read from Delta, per path and read options, least recently used evicted first
+DELTA_CACHE_BYTES = int(os.environ.get("DELTA_CACHE_BYTES", 512 * 1024**2))
+delta_snapshots = OrderedDict()
+delta_snapshots_lock = threading.Lock()
+delta_snapshot_stats = {"hits": 0, "appends": 0, "loads": 0, "evictions": 0}
+
+# Guards the per-table consumer checkpoint files
+delta_checkpoints_lock = threading.Lock()
+
+CONNECTION_STR = (
+    f"localhost:5678?auth=basic;user=mapr;password=mapr;"
+    "ssl=true;"
+    "sslCA=/opt/mapr/conf/ssl_truststore.pem;"
+    f"sslTargetNameOverride={CLUSTER_NAME}"
+)
+
+
+def connect():
     """
-    Returns an OJAIConnection object for configured cluster
+    Returns a new OJAIConnection object for configured cluster
     """
 
     tick = timeit.default_timer()
 
-    # Use singleton
-    global ojaiconnection
-    if ojaiconnection is not None:
-        return ojaiconnection
-
-    connection_str = (
-        f"localhost:5678?auth=basic;user=mapr;password=mapr;"
-        "ssl=true;"
-        "sslCA=/opt/mapr/conf/ssl_truststore.pem;"
-        f"sslTargetNameOverride={CLUSTER_NAME}"
-    )
-
-    ojaiconnection = ConnectionFactory.get_connection(connection_str=connection_str)
+    connection = ConnectionFactory.get_connection(connection_str=CONNECTION_STR)
     logger.info(
         "Got new maprdb connection using OJAI in %f sec", timeit.default_timer() - tick
     )
 
-    return ojaiconnection
+    return connection
+
+
+class PooledConnection:
+    """
+    An OJAIConnection with an LRU cache of its store handles, keyed by table path
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.stores = OrderedDict()
+        self.last_used = timeit.default_timer()
+
+    def store(self, table_path: str, create: bool = False):
+        """
+        Returns the cached store handle, looking it up on a miss
+
+        :param create bool: create the table if it does not exist
+        """
+        store = self.stores.get(table_path)
+        if store is not None:
+            self.stores.move_to_end(table_path)
+            return store
+
+        if create:
+            store = self.connection.get_or_create_store(table_path)
+        else:
+            store = self.connection.get_store(table_path)
+
+        self.stores[table_path] = store
+        if len(self.stores) > STORE_CACHE_SIZE:
+            self.stores.popitem(last=False)
+        return store
+
+    def new_document(self, **kwargs):
+        return self.connection.new_document(**kwargs)
+
+    def healthy(self):
+        try:
+            self.connection.is_store_exists(HEALTH_CHECK_PATH)
+            return True
+        except Exception as error:
+            logger.warning("OJAI connection failed health check: %s", error)
+            return False
+
+    def close(self):
+        self.stores.clear()
+        try:
+            self.connection.close()
+        except Exception as error:
+            logger.debug(error)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of up to `size` OJAI connections, opened on demand
+
+    A connection is checked out by one thread at a time. Connections idle for longer
+    than HEALTH_CHECK_INTERVAL are checked on checkout, and after a failed operation,
+    and replaced if they do not respond.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.available = threading.Condition()
+        self.stats = {"opened": 0, "discarded": 0, "waits": 0}
+
+    def acquire(self):
+        deadline = timeit.default_timer() + self.timeout
+        while True:
+            pooled = None
+            with self.available:
+                while not self.idle and self.opened >= self.size:
+                    remaining = deadline - timeit.default_timer()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No OJAI connection available in {self.timeout} sec"
+                        )
+                    self.stats["waits"] += 1
+                    self.available.wait(remaining)
+
+                if self.idle:
+                    pooled = self.idle.pop()
+                else:
+                    self.opened += 1
+
+            if pooled is None:
+                try:
+                    pooled = PooledConnection(connect())
+                except Exception:
+                    self.forget()
+                    raise
+                self.stats["opened"] += 1
+                return pooled
+
+            if (
+                timeit.default_timer() - pooled.last_used < HEALTH_CHECK_INTERVAL
+                or pooled.healthy()
+            ):
+                return pooled
+
+            self.discard(pooled)
+
+    def release(self, pooled: PooledConnection, failed: bool = False):
+        if failed:
+            # handles may point to a dropped table, look them up again
+            pooled.stores.clear()
+            if not pooled.healthy():
+                self.discard(pooled)
+                return
+
+        pooled.last_used = timeit.default_timer()
+        with self.available:
+            self.idle.append(pooled)
+            self.available.notify()
+
+    def discard(self, pooled: PooledConnection):
+        pooled.close()
+        self.stats["discarded"] += 1
+        self.forget()
+
+    def forget(self):
+        with self.available:
+            self.opened -= 1
+            self.available.notify()
+
+    @contextmanager
+    def connection(self):
+        pooled = self.acquire()
+        failed = False
+        try:
+            yield pooled
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(pooled, failed)
+
+    def close(self):
+        with self.available:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            self.discard(pooled)
+
+
+def get_pool():
+    """
+    Returns the process wide ConnectionPool
+    """
+    global connection_pool
+    with connection_pool_lock:
+        if connection_pool is None:
+            connection_pool = ConnectionPool()
+        return connection_pool
+
+
+def get_bulk_pool():
+    global bulk_pool
+    if bulk_pool is None:
+        bulk_pool = ThreadPoolExecutor(
+            max_workers=BULK_WORKERS, thread_name_prefix="ojai-bulk"
+        )
+    return bulk_pool
 
 
 def upsert_document(table_path: str, json_dict: dict):
@@ -56,15 +253,14 @@ def upsert_document(table_path: str, json_dict: dict):
     """
 
     try:
-        connection = get_connection()
-
-        store = connection.get_or_create_store(table_path)
+        with get_pool().connection() as connection:
+            store = connection.store(table_path, create=True)
 
-        new_document = connection.new_document(dictionary=json_dict)
+            new_document = connection.new_document(dictionary=json_dict)
 
-        # logger.debug("upsert new doc: %s", new_document)
+            # logger.debug("upsert new doc: %s", new_document)
 
-        store.insert_or_replace(new_document)
+            store.insert_or_replace(new_document)
 
         logger.info("doc upserted %s", json_dict["_id"])
 
@@ -78,40 +274,139 @@ def upsert_document(table_path: str, json_dict: dict):
     return True
 
 
-async def upsert_documents(table_path: str, docs: list):
+def chunked(docs, chunk_size: int, max_chunk_bytes: int = None):
     """
-    Update or insert a document into the OJAI store (table)
+    Group documents from any iterable into lists of at most `chunk_size` docs
+    and, if given, roughly `max_chunk_bytes` of JSON
+    """
+    chunk = []
+    chunk_bytes = 0
+    for doc in docs:
+        if max_chunk_bytes:
+            size = len(json.dumps(doc, default=str))
+            if chunk and chunk_bytes + size > max_chunk_bytes:
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk_bytes += size
+        chunk.append(doc)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        yield chunk
+
+
+async def bulk_upsert(
+    table_path: str,
+    docs,
+    chunk_size: int = 1000,
+    max_chunk_bytes: int = 4 * 1024**2,
+    workers: int = BULK_WORKERS,
+    retries: int = 3,
+    backoff: float = 0.5,
+):
+    """
+    Update or insert documents in size-bounded chunks, written concurrently
+
+    Documents are read lazily from `docs`, at most `2 * workers` chunks are held
+    in memory. Each write checks out a pooled connection, and a failed
+    chunk is retried on its own with exponential backoff.
 
     :param table_path str: full table path under the selected cluster
-    :param docs list[dict]: list of JSON serializable objects to insert/update
+    :param docs iterable[dict]: JSON serializable objects to insert/update, each with an `_id`
+    :param chunk_size int: max documents per write
+    :param max_chunk_bytes int: approximate max JSON size per write, None to only count docs
+    :param workers int: concurrent writes, up to BULK_WORKERS
+    :param retries int: attempts per chunk after the first failure
+    :param backoff float: seconds before the first retry, doubled on each attempt
+
+    :return dict: overall result, document count, docs/sec and per-chunk results
+    """
 
-    :return bool: result of operation
+    def write(chunk: list):
+        with get_pool().connection() as connection:
+            connection.store(table_path, create=True).insert_or_replace(
+                doc_stream=chunk
+            )
 
-    """
+    async def write_chunk(number: int, chunk: list):
+        result = {"chunk": number, "docs": len(chunk), "attempts": 0, "ok": False}
+        try:
+            for attempt in range(retries + 1):
+                result["attempts"] = attempt + 1
+                try:
+                    await loop.run_in_executor(pool, write, chunk)
+                    result["ok"] = True
+                    result.pop("error", None)
+                    break
+                except Exception as error:
+                    result["error"] = str(error)
+                    logger.warning(
+                        "Chunk %d attempt %d failed: %s", number, attempt + 1, error
+                    )
+                    if attempt < retries:
+                        await asyncio.sleep(backoff * 2**attempt)
+            if not result["ok"]:
+                result["first_id"] = chunk[0].get("_id")
+                result["last_id"] = chunk[-1].get("_id")
+            return result
+        finally:
+            slots.release()
+
+    loop = asyncio.get_running_loop()
+    pool = get_bulk_pool()
+    slots = asyncio.Semaphore(workers * 2)
+    tick = timeit.default_timer()
 
-    try:
-        connection = get_connection()
+    tasks = []
+    for number, chunk in enumerate(chunked(docs, chunk_size, max_chunk_bytes)):
+        await slots.acquire()
+        tasks.append(asyncio.create_task(write_chunk(number, chunk)))
+    results = await asyncio.gather(*tasks)
+
+    elapsed = timeit.default_timer() - tick
+    written = sum(r["docs"] for r in results if r["ok"])
+    report = {
+        "ok": all(r["ok"] for r in results),
+        "docs": written,
+        "failed_docs": sum(r["docs"] for r in results if not r["ok"]),
+        "secs": elapsed,
+        "docs_per_sec": written / elapsed if elapsed else 0,
+        "chunks": results,
+    }
+
+    logger.info(
+        "Upserted %d documents in %d chunks into %s in %.3f sec (%.0f docs/sec), %d failed",
+        written,
+        len(results),
+        table_path,
+        elapsed,
+        report["docs_per_sec"],
+        report["failed_docs"],
+    )
 
-        store = connection.get_or_create_store(table_path)
+    return report
 
-        logger.info("Upserting %d documents from list", len(docs))
 
-        tick = timeit.default_timer()
+async def upsert_documents(table_path: str, docs):
+    """
+    Update or insert a document into the OJAI store (table)
 
-        # logger.debug(docs)
-        store.insert_or_replace(doc_stream=docs)
+    :param table_path str: full table path under the selected cluster
+    :param docs iterable[dict]: JSON serializable objects to insert/update
+
+    :return bool: result of operation, see bulk_upsert for details per chunk
 
-        logger.debug("doc insert took %fs", timeit.default_timer() - tick)
+    """
+
+    try:
+        report = await bulk_upsert(table_path, docs)
 
     except Exception as error:
         logger.warning(error)
         return False
 
-    finally:
-        logger.info("%d documents processed", len(docs))
-    #     if connection: connection.close()
-
-    return True
+    return report["ok"]
 
 
 def find_document_by_id(table: str, docid: str):
@@ -119,13 +414,12 @@ def find_document_by_id(table: str, docid: str):
     doc = None
 
     try:
-        connection = get_connection()
-
-        # Get a store and assign it as a DocumentStore object
-        store = connection.get_store(table)
+        with get_pool().connection() as connection:
+            # Get a store and assign it as a DocumentStore object
+            store = connection.store(table)
 
-        # fetch the OJAI Document by its 'id' field
-        doc = store.find_by_id(docid)
+            # fetch the OJAI Document by its 'id' field
+            doc = store.find_by_id(docid)
 
     except Exception as error:
         logger.warning(error)
@@ -136,30 +430,173 @@ def find_document_by_id(table: str, docid: str):
         return doc
 
 
-def search_documents(table: str, selectClause: list, whereClause: dict):
+class Query:
+    """
+    Fluent builder for OJAI JSON queries, run on the server with a single find
 
-    doc = None
+        Query("/apps/customers").select("_id", "name").where(
+            {"$eq": {"country": "UK"}}
+        ).order_by("name").limit(100).to_pandas()
 
-    try:
-        connection = get_connection()
+    Only the selected fields are sent back, and to_arrow/to_pandas build columns
+    from whole batches of result dicts.
+    """
 
-        # Get a store and assign it as a DocumentStore object
-        table = connection.get_store(table)
+    # Results as plain dicts, not Document objects to convert one by one
+    FIND_OPTIONS = {"ojai.mapr.query.result-as-document": False}
+
+    def __init__(self, table_path: str):
+        self.table_path = table_path
+        self.fields = []
+        self.conditions = []
+        self.order = []
+        self.limit_count = None
+        self.offset_count = None
+
+    def select(self, *fields: str):
+        self.fields.extend(fields)
+        return self
+
+    def where(self, condition: dict):
+        """
+        Add an OJAI JSON condition, multiple conditions are combined with $and
+        """
+        if condition:
+            self.conditions.append(condition)
+        return self
+
+    def order_by(self, field: str, order: str = "asc"):
+        self.order.append({field: order})
+        return self
+
+    def limit(self, count: int):
+        self.limit_count = count
+        return self
+
+    def offset(self, count: int):
+        self.offset_count = count
+        return self
+
+    def to_json(self):
+        """
+        Returns the OJAI JSON query
+        """
+        query = {"$select": self.fields or ["*"]}
+
+        if len(self.conditions) == 1:
+            query["$where"] = self.conditions[0]
+        elif self.conditions:
+            query["$where"] = {"$and": self.conditions}
+
+        if len(self.order) == 1:
+            query["$orderby"] = self.order[0]
+        elif self.order:
+            query["$orderby"] = self.order
+
+        if self.offset_count is not None:
+            query["$offset"] = self.offset_count
+        if self.limit_count is not None:
+            query["$limit"] = self.limit_count
+
+        return query
+
+    def documents(self):
+        """
+        Run the query and yield documents as dicts, holding a pooled connection until exhausted
+        """
+        query = self.to_json()
+        logger.info("Query: %s", query)
 
-        # Create an OJAI query
-        query = {"$select": selectClause, "$where": whereClause}
+        with get_pool().connection() as connection:
+            store = connection.store(self.table_path)
+            yield from store.find(query, options=self.FIND_OPTIONS)
+
+    def pages(self, page_size: int = 100):
+        """
+        Run the query and yield documents in lists of `page_size`
+        """
+        page = []
+        for doc in self.documents():
+            page.append(doc)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def to_arrow(self, batch_size: int = 10_000):
+        """
+        Run the query and return the results as a pyarrow Table, converted a batch at a time
+        """
+        import pyarrow as pa
+
+        batches = [pa.Table.from_pylist(page) for page in self.pages(batch_size)]
+        if not batches:
+            return pa.table({field: [] for field in self.fields})
+
+        return pa.concat_tables(batches, promote_options="permissive")
+
+    def to_pandas(self, batch_size: int = 10_000):
+        return self.to_arrow(batch_size).to_pandas()
+
+    def explain(self):
+        """
+        Run the query with its plan included, and time it
+
+        :returns dict: query, server plan, indexes used, seconds to first and all results
+        """
+        query = self.to_json()
+        options = {**self.FIND_OPTIONS, "ojai.mapr.query.include-query-plan": True}
+
+        tick = timeit.default_timer()
+        first_result_secs = None
+        count = 0
+
+        with get_pool().connection() as connection:
+            result = connection.store(self.table_path).find(query, options=options)
+            for _ in result:
+                if first_result_secs is None:
+                    first_result_secs = timeit.default_timer() - tick
+                count += 1
+            plan = result.get_query_plan()
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return {
+            "query": query,
+            "plan": plan,
+            "indexes": sorted(set(plan_indexes(plan))),
+            "documents": count,
+            "first_result_secs": first_result_secs,
+            "secs": timeit.default_timer() - tick,
+        }
+
+
+def plan_indexes(plan):
+    """
+    Yield index names referenced anywhere in a query plan, the primary table shows as its path
+    """
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key in ("indexName", "index") and isinstance(value, str):
+                yield value
+            else:
+                yield from plan_indexes(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_indexes(item)
 
-        logger.info("Query: %s", query)
 
-        # options for find request
-        options = {"ojai.mapr.query.result-as-document": True}
+def search_documents(table: str, selectClause: list, whereClause: dict):
 
-        # fetch OJAI Documents by query
-        query_result = table.find(query, options=options)
+    doc = None
 
-        # Print OJAI Documents from document stream
-        for doc in query_result:
-            yield doc.as_dictionary()
+    try:
+        # fetch documents by query, as dicts
+        query = Query(table).select(*selectClause).where(whereClause)
+        for doc in query.documents():
+            yield doc
 
     except Exception as error:
         logger.warning(error)
@@ -170,51 +607,73 @@ def search_documents(table: str, selectClause: list, whereClause: dict):
         return doc
 
 
-async def get_documents(table_path: str, limit: int = 10):
+def iter_documents(
+    table_path: str,
+    page_size: int = 100,
+    limit: int = None,
+    after_id: str = None,
+    select: list = None,
+    where: dict = None,
+):
     """
-    Read `limit` records from the table to peek data
-
-    :param table str: full path for the JSON table
+    Run the query once and yield its documents in pages, in `_id` order
 
-    :param limit int: Number of records to return, default is 10, if None, returns all documents
+    Stop iterating to stop reading. To resume later, pass the `_id` of the last
+    document seen as `after_id`.
 
-    :returns list[doc]: list of documents as JSON objects
+    :param table_path str: full path for the JSON table
+    :param page_size int: number of documents per page
+    :param limit int: max number of documents, None for all
+    :param after_id str: only documents with a greater `_id`
+    :param select list: fields to return, default all
+    :param where dict: OJAI JSON condition
 
+    :returns generator[list[doc]]: pages of documents as JSON objects
     """
 
-    try:
-        # logger.debug("Requesting docs from %s", table_path)
+    count = 0
+    tick = timeit.default_timer()
 
-        # tick = timeit.default_timer()
-        connection = get_connection()
-        # logger.debug("Got ojai connection in %f sec", timeit.default_timer() - tick)
+    try:
+        query = Query(table_path).select(*(select or [])).where(where).order_by("_id")
+        if after_id is not None:
+            query.where({"$gt": {"_id": after_id}})
+        if limit is not None:
+            query.limit(limit)
 
-        # tick = timeit.default_timer()
-        table = connection.get_store(table_path)
-        # logger.debug("Got store in %f sec", timeit.default_timer() - tick)
+        for page in query.pages(page_size):
+            count += len(page)
+            yield page
 
-        # Create a query to get the last n records based on the timestamp field
-        if limit is not None:
-            query = connection.new_query().select("*").limit(limit).build()
-        else:
-            query = connection.new_query().select("*").build()
+    except Exception as error:
+        logger.warning("Failed to get documents: %s", error)
 
-        tick = timeit.default_timer()
-        # Run the query and return the results as list
+    finally:
         logger.debug(
             "Returned %d docs in %s, took %f sec",
-            len([doc for doc in table.find(query)]),
+            count,
             table_path,
             timeit.default_timer() - tick,
         )
-        # tick = timeit.default_timer()
-        results = table.find(query)
-        # logger.debug("TEST time: %f", timeit.default_timer() - tick)
-        return [doc for doc in results]
 
-    except Exception as error:
-        logger.warning("Failed to get document: %s", error)
-        return []
+
+async def get_documents(table_path: str, limit: int = 10):
+    """
+    Read `limit` records from the table to peek data
+
+    :param table str: full path for the JSON table
+
+    :param limit int: Number of records to return, default is 10, if None, returns all documents
+
+    :returns list[doc]: list of documents as JSON objects
+
+    """
+
+    return [
+        doc
+        for page in iter_documents(table_path, page_size=limit or 1000, limit=limit)
+        for doc in page
+    ]
 
 
 # SSE-TODO: binary table create/read/write functions
@@ -248,6 +707,44 @@ def binary_table_get_all(table_path: str):
     utils.not_implemented()
 
 
+def delta_merge(table_uri: str, df: pd.DataFrame):
+    """
+    Merge records into the Delta table on `_id`, creating the table if missing
+
+    :returns dict: merge metrics from deltalake, row and file counts for a new table
+    """
+
+    if not os.path.exists(table_uri):
+        write_deltalake(
+            table_or_uri=table_uri, data=df, mode="append", schema_mode="merge"
+        )
+        logger.debug("Created new Delta table in %s", table_uri)
+        return {
+            "num_source_rows": len(df),
+            "num_output_rows": len(df),
+            "num_target_files_added": len(DeltaTable(table_uri).file_uris()),
+            "num_target_files_removed": 0,
+        }
+
+    dt = DeltaTable(table_uri=table_uri)
+
+    merge_result = (
+        dt.merge(
+            source=df,
+            predicate="s._id = t._id",
+            source_alias="s",
+            target_alias="t",
+        )
+        .when_matched_update_all()
+        .when_not_matched_insert_all()
+        .execute()
+    )
+
+    logger.debug(merge_result)
+
+    return merge_result
+
+
 async def delta_table_upsert(table_path: str, records: pd.DataFrame):
     """
     Write list of dicts into Delta Lake table
@@ -258,27 +755,7 @@ async def delta_table_upsert(table_path: str, records: pd.DataFrame):
 
         df = pd.DataFrame().from_records(records)
 
-        if not os.path.exists(table_uri):
-            write_deltalake(
-                table_or_uri=table_uri, data=df, mode="append", schema_mode="merge"
-            )
-            logger.debug("Created new Delta table in %s", table_uri)
-        else:
-            dt = DeltaTable(table_uri=table_uri)
-
-            merge_result = (
-                dt.merge(
-                    source=df,
-                    predicate="s._id = t._id",
-                    source_alias="s",
-                    target_alias="t",
-                )
-                .when_matched_update_all()
-                .when_not_matched_insert_all()
-                .execute()
-            )
-
-            logger.debug(merge_result)
+        delta_merge(table_uri, df)
 
     except Exception as error:
         logger.error("Failed to write: %s", table_path)
@@ -288,9 +765,364 @@ async def delta_table_upsert(table_path: str, records: pd.DataFrame):
     return True
 
 
-async def delta_table_get(table_path, query: str = ""):
+def delta_maintain(table_uri: str, zorder: bool = False, retention_hours: int = None):
     """
-    Returns all records from the binary table as DataFrame
+    Compact small files (optionally Z-ordered on `_id`), checkpoint the log and vacuum
+
+    :returns dict: optimize metrics, removed file count and data files left
+    """
+
+    dt = DeltaTable(table_uri)
+
+    if zorder:
+        optimized = dt.optimize.z_order(["_id"])
+    else:
+        optimized = dt.optimize.compact()
+
+    dt.create_checkpoint()
+    vacuumed = dt.vacuum(retention_hours=retention_hours, dry_run=False)
+
+    return {
+        "optimize": optimized,
+        "vacuumed": len(vacuumed),
+        "files": len(dt.file_uris()),
+    }
+
+
+class DeltaWriter:
+    """
+    Buffers records for a Delta table and merges them in one go once the buffer
+    holds `max_rows` rows or its oldest record is `max_secs` old
+
+    After start(), a background task also flushes an idle buffer on time and runs
+    delta_maintain every `maintenance_interval` seconds. Merges and maintenance are
+    never run at the same time, so they do not conflict on commit.
+    """
+
+    def __init__(
+        self,
+        table_path: str,
+        max_rows: int = DELTA_BUFFER_ROWS,
+        max_secs: float = DELTA_BUFFER_SECS,
+        maintenance_interval: float = DELTA_MAINTENANCE_INTERVAL,
+        zorder: bool = False,
+        retention_hours: int = None,
+    ):
+        self.table_uri = f"/{MOUNT_PATH}/{table_path}"
+        self.max_rows = max_rows
+        self.max_secs = max_secs
+        self.maintenance_interval = maintenance_interval
+        self.zorder = zorder
+        self.retention_hours = retention_hours
+
+        self.buffer = []
+        self.buffered_rows = 0
+        self.buffered_since = None
+        # add() calls so far, and the last of them covered by a successful merge
+        self.added_seq = 0
+        self.merged_seq = 0
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.last_maintenance = timeit.default_timer()
+        self.metrics = {
+            "rows_received": 0,
+            "rows_merged": 0,
+            "rows_rewritten": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "files_added": 0,
+            "files_removed": 0,
+            "files": None,
+            "compactions": 0,
+            "vacuumed_files": 0,
+            # rows written to storage per row received, merges rewrite whole files
+            "write_amplification": 0,
+        }
+
+    def due(self):
+        return self.buffered_rows >= self.max_rows or (
+            self.buffered_since is not None
+            and timeit.default_timer() - self.buffered_since >= self.max_secs
+        )
+
+    async def add(self, records: pd.DataFrame):
+        """
+        Buffer records, merging the buffer if it is due
+
+        :returns bool: False if a merge failed, the records stay buffered for the next attempt
+        """
+        if len(records):
+            self.added_seq += 1
+            self.buffer.append(records)
+            self.buffered_rows += len(records)
+            self.metrics["rows_received"] += len(records)
+            if self.buffered_since is None:
+                self.buffered_since = timeit.default_timer()
+
+        if self.due():
+            return await self.flush()
+        return True
+
+    def merged(self):
+        """
+        True once every record added so far has been merged into the table
+        """
+        return self.merged_seq == self.added_seq
+
+    async def flush(self):
+        """
+        Merge everything buffered into the table
+
+        Records added while the merge runs are kept for the next flush.
+
+        :returns bool: result of merge
+        """
+        async with self.lock:
+            if not self.buffer:
+                return True
+
+            # take the buffer before awaiting, add() keeps filling a new one
+            pending, pending_rows, pending_since, pending_seq = (
+                self.buffer,
+                self.buffered_rows,
+                self.buffered_since,
+                self.added_seq,
+            )
+            self.buffer, self.buffered_rows, self.buffered_since = [], 0, None
+
+            # merge needs unique source keys, keep the latest version of each document
+            df = (
+                pd.concat(pending, ignore_index=True)
+                .drop_duplicates("_id", keep="last")
+                .reset_index(drop=True)
+            )
+            tick = timeit.default_timer()
+
+            try:
+                merged = await asyncio.to_thread(delta_merge, self.table_uri, df)
+            except Exception as error:
+                # put the records back ahead of anything added since
+                self.buffer = pending + self.buffer
+                self.buffered_rows += pending_rows
+                self.buffered_since = pending_since
+                self.metrics["failed_flushes"] += 1
+                logger.error("Failed to write: %s", self.table_uri)
+                logger.error(error)
+                return False
+
+            self.merged_seq = pending_seq
+
+            metrics = self.metrics
+            metrics["flushes"] += 1
+            metrics["rows_merged"] += merged.get("num_source_rows", len(df))
+            metrics["rows_rewritten"] += merged.get("num_output_rows", len(df))
+            metrics["files_added"] += merged.get("num_target_files_added", 0)
+            metrics["files_removed"] += merged.get("num_target_files_removed", 0)
+            if metrics["files"] is None:
+                metrics["files"] = await asyncio.to_thread(
+                    lambda: len(DeltaTable(self.table_uri).file_uris())
+                )
+            else:
+                metrics["files"] += merged.get(
+                    "num_target_files_added", 0
+                ) - merged.get("num_target_files_removed", 0)
+            metrics["write_amplification"] = metrics["rows_rewritten"] / max(
+                metrics["rows_merged"], 1
+            )
+
+            logger.info(
+                "Merged %d rows into %s in %.3f sec, %d rows rewritten",
+                len(df),
+                self.table_uri,
+                timeit.default_timer() - tick,
+                merged.get("num_output_rows", len(df)),
+            )
+            return True
+
+    async def maintain(self):
+        """
+        Run delta_maintain on the table, after merging anything buffered
+        """
+        await self.flush()
+        async with self.lock:
+            self.last_maintenance = timeit.default_timer()
+            if not os.path.exists(self.table_uri):
+                return
+
+            try:
+                result = await asyncio.to_thread(
+                    delta_maintain, self.table_uri, self.zorder, self.retention_hours
+                )
+            except Exception as error:
+                logger.warning("Maintenance failed for %s: %s", self.table_uri, error)
+                return
+
+            self.metrics["compactions"] += 1
+            self.metrics["vacuumed_files"] += result["vacuumed"]
+            self.metrics["files"] = result["files"]
+            logger.info(
+                "Maintained %s: %s, vacuumed %d files, %d files left",
+                self.table_uri,
+                result["optimize"],
+                result["vacuumed"],
+                result["files"],
+            )
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(min(self.max_secs, self.maintenance_interval))
+            if self.due():
+                await self.flush()
+            if (
+                timeit.default_timer() - self.last_maintenance
+                >= self.maintenance_interval
+            ):
+                await self.maintain()
+
+    def start(self):
+        """
+        Start the background flush and maintenance task on the running event loop
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return self
+
+    async def close(self):
+        """
+        Stop the background task and merge whatever is still buffered
+
+        :returns bool: result of the last merge
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        return await self.flush()
+
+
+def delta_filter(filters):
+    """
+    Returns a pyarrow Expression for DNF filters, ie [("country", "=", "UK"), ("age", ">", 30)]
+    """
+    if filters is None or isinstance(filters, pc.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+
+def delta_dataset(fullpath: str, partitions: list = None):
+    """
+    Delta table as a pyarrow Dataset, one fragment per data file
+
+    Fragments carry partition values and Delta min/max statistics, so filters skip
+    whole files before anything is read.
+
+    :param partitions list: DNF filters on partition columns, to only list matching files
+    """
+    return DeltaTable(fullpath).to_pyarrow_dataset(partitions=partitions)
+
+
+def delta_snapshot(
+    fullpath: str, columns: list = None, partitions: list = None, filters=None
+):
+    """
+    Returns the Delta table as a pyarrow Table, from the snapshot cache when possible
+
+    The table log is brought up to date first. If the version is unchanged the
+    cached table is returned as is. If files were only added since, just those are
+    read and appended. Anything else, ie compaction, deletes or schema changes,
+    reads the table again.
+    """
+    expression = delta_filter(filters)
+    key = (
+        fullpath,
+        tuple(columns) if columns else None,
+        repr(partitions),
+        str(expression),
+    )
+
+    with delta_snapshots_lock:
+        entry = delta_snapshots.setdefault(
+            key, {"lock": threading.Lock(), "dt": None, "version": None, "bytes": 0}
+        )
+        delta_snapshots.move_to_end(key)
+
+    with entry["lock"]:
+        if entry["dt"] is None:
+            entry["dt"] = DeltaTable(fullpath)
+        else:
+            entry["dt"].update_incremental()
+
+        dt = entry["dt"]
+        version = dt.version()
+        if version == entry["version"]:
+            delta_snapshot_stats["hits"] += 1
+            table = entry["table"]
+        else:
+            dataset = delta_dataset(fullpath, partitions)
+            fragments = {
+                fragment.path: fragment for fragment in dataset.get_fragments()
+            }
+
+            if (
+                entry["version"] is not None
+                and entry["files"] <= fragments.keys()
+                and entry["schema"] == dataset.schema
+            ):
+                added = ds.FileSystemDataset(
+                    [fragments[path] for path in fragments.keys() - entry["files"]],
+                    dataset.schema,
+                    dataset.format,
+                    dataset.filesystem,
+                )
+                table = pa.concat_tables(
+                    [
+                        entry["table"],
+                        added.to_table(columns=columns, filter=expression),
+                    ]
+                )
+                delta_snapshot_stats["appends"] += 1
+            else:
+                table = dataset.to_table(columns=columns, filter=expression)
+                delta_snapshot_stats["loads"] += 1
+
+            entry.update(
+                version=version,
+                files=set(fragments),
+                schema=dataset.schema,
+                table=table,
+                bytes=table.nbytes,
+            )
+
+    with delta_snapshots_lock:
+        total = sum(e["bytes"] for e in delta_snapshots.values())
+        while total > DELTA_CACHE_BYTES and delta_snapshots:
+            _, evicted = delta_snapshots.popitem(last=False)
+            total -= evicted["bytes"]
+            delta_snapshot_stats["evictions"] += 1
+
+    return table
+
+
+async def delta_table_get(
+    table_path,
+    query: str = "",
+    columns: list = None,
+    partitions: list = None,
+    filters=None,
+    cache: bool = True,
+):
+    """
+    Returns records from the Delta table as DataFrame
+
+    :param table_path str: table path under the cluster mount
+    :param query str: pandas query applied after reading, prefer `filters`
+    :param columns list: columns to read, default all
+    :param partitions list: DNF filters on partition columns
+    :param filters list|pc.Expression: DNF filters or expression on any column, pushed down to the scan
+    :param cache bool: read through the snapshot cache, see delta_snapshot
     """
 
     fullpath = f"{MOUNT_PATH}/{table_path}"
@@ -300,12 +1132,269 @@ async def delta_table_get(table_path, query: str = ""):
         return pd.DataFrame()
 
     try:
+        tick = timeit.default_timer()
+
+        if cache:
+            table = delta_snapshot(fullpath, columns, partitions, filters)
+        else:
+            dataset = delta_dataset(fullpath, partitions)
+            table = dataset.to_table(columns=columns, filter=delta_filter(filters))
+        logger.debug(
+            "Read %d rows from %s in %f sec",
+            table.num_rows,
+            fullpath,
+            timeit.default_timer() - tick,
+        )
+
         if not query:
-            return DeltaTable(fullpath).to_pandas()
+            return table.to_pandas()
         else:
-            return DeltaTable(fullpath).to_pandas().query(query)
+            return table.to_pandas().query(query)
 
     except Exception as error:
         logger.error("Failed to read: %s", fullpath)
         logger.error(error)
         return pd.DataFrame()
+
+
+def delta_table_batches(
+    table_path,
+    columns: list = None,
+    partitions: list = None,
+    filters=None,
+    batch_size: int = 64 * 1024,
+):
+    """
+    Stream records from the Delta table as pyarrow RecordBatches, for tables larger than memory
+
+    Same pushdown as delta_table_get, only one batch is decoded at a time.
+
+    :returns generator[pa.RecordBatch]: batches of at most `batch_size` rows
+    """
+
+    fullpath = f"{MOUNT_PATH}/{table_path}"
+
+    if not os.path.exists(fullpath):
+        logger.warning("%s not created yet", fullpath)
+        return
+
+    try:
+        dataset = delta_dataset(fullpath, partitions)
+        yield from dataset.to_batches(
+            columns=columns, filter=delta_filter(filters), batch_size=batch_size
+        )
+
+    except Exception as error:
+        logger.error("Failed to read: %s", fullpath)
+        logger.error(error)
+
+
+def delta_checkpoints_file(fullpath: str):
+    """
+    Consumer checkpoints live in a hidden file next to the table, not inside it, so vacuum leaves them alone
+    """
+    parent, name = os.path.split(fullpath.rstrip("/"))
+    return os.path.join(parent, f".{name}.consumers.json")
+
+
+def delta_consumer_version(table_path: str, consumer: str):
+    """
+    Returns the last table version read by the consumer, None if it has not read yet
+    """
+    checkpoints_file = delta_checkpoints_file(f"{MOUNT_PATH}/{table_path}")
+    with delta_checkpoints_lock:
+        if not os.path.exists(checkpoints_file):
+            return None
+        with open(checkpoints_file) as f:
+            return json.load(f).get(consumer)
+
+
+def delta_commit_version(table_path: str, consumer: str, version: int):
+    """
+    Record the last table version read by the consumer
+    """
+    checkpoints_file = delta_checkpoints_file(f"{MOUNT_PATH}/{table_path}")
+    with delta_checkpoints_lock:
+        checkpoints = {}
+        if os.path.exists(checkpoints_file):
+            with open(checkpoints_file) as f:
+                checkpoints = json.load(f)
+
+        checkpoints[consumer] = version
+
+        with open(checkpoints_file + ".tmp", "w") as f:
+            json.dump(checkpoints, f)
+        os.replace(checkpoints_file + ".tmp", checkpoints_file)
+
+
+def delta_timestamp_version(dt: DeltaTable, timestamp):
+    """
+    Returns the first version committed at or after the timestamp, naive timestamps are UTC
+    """
+    ts = pd.Timestamp(timestamp)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    millis = ts.value // 10**6
+
+    versions = [h["version"] for h in dt.history() if h["timestamp"] >= millis]
+    return min(versions) if versions else dt.version() + 1
+
+
+def delta_cdf_changes(dt: DeltaTable, start: int, end: int):
+    """
+    Rows changed in versions start..end, read from the change data feed
+    """
+    reader = pa.RecordBatchReader.from_stream(
+        dt.load_cdf(starting_version=start, ending_version=end)
+    )
+    df = reader.read_all().to_pandas()
+    return df[df["_change_type"] != "update_preimage"]
+
+
+def delta_diff_changes(fullpath: str, dt: DeltaTable, start: int):
+    """
+    Rows changed in versions start..latest, by diffing the data files of both snapshots
+
+    Merges rewrite whole files, so rows only copied from a removed file into an
+    added one are dropped. Files removed since must not have been vacuumed yet.
+    """
+    dataset = dt.to_pyarrow_dataset()
+    fragments = {fragment.path: fragment for fragment in dataset.get_fragments()}
+
+    old_dataset = None
+    old_fragments = {}
+    if start > 0:
+        old_dataset = DeltaTable(fullpath, version=start - 1).to_pyarrow_dataset()
+        old_fragments = {
+            fragment.path: fragment for fragment in old_dataset.get_fragments()
+        }
+
+    def read(source, paths):
+        files = ds.FileSystemDataset(
+            [source[1][path] for path in paths],
+            source[0].schema,
+            source[0].format,
+            source[0].filesystem,
+        )
+        return files.to_table().to_pandas()
+
+    added = read((dataset, fragments), fragments.keys() - old_fragments.keys())
+    if old_dataset is None:
+        removed = pd.DataFrame(columns=added.columns)
+    else:
+        removed = read(
+            (old_dataset, old_fragments), old_fragments.keys() - fragments.keys()
+        )
+
+    removed_ids = set(removed["_id"])
+    added_ids = set(added["_id"])
+
+    # compare whole rows as strings, values may be lists or dicts
+    columns = list(added.columns)
+    before = dict(
+        zip(
+            removed["_id"],
+            removed.reindex(columns=columns).astype(str).agg("|".join, axis=1),
+        )
+    )
+    after = added.astype(str).agg("|".join, axis=1)
+
+    changed = [
+        _id not in removed_ids or before[_id] != row
+        for _id, row in zip(added["_id"], after)
+    ]
+    upserts = added[pd.Series(changed, index=added.index, dtype=bool)].copy()
+    upserts["_change_type"] = [
+        "update_postimage" if _id in removed_ids else "insert"
+        for _id in upserts["_id"]
+    ]
+
+    deletes = removed[~removed["_id"].isin(added_ids)].copy()
+    deletes["_change_type"] = "delete"
+
+    df = pd.concat([upserts, deletes], ignore_index=True)
+    df["_commit_version"] = dt.version()
+    return df
+
+
+async def delta_table_changes(
+    table_path,
+    starting_version: int = None,
+    starting_timestamp=None,
+    consumer: str = None,
+    commit: bool = True,
+):
+    """
+    Returns rows inserted, updated or deleted in the Delta table since a version or timestamp
+
+    Reads the change data feed if the table has delta.enableChangeDataFeed set,
+    otherwise diffs the data files of the two snapshots, in which case every
+    change is reported with the latest version as its `_commit_version`.
+
+    :param table_path str: table path under the cluster mount
+    :param starting_version int: first version to include
+    :param starting_timestamp str|datetime: first commit time to include, if no starting_version
+    :param consumer str: read from the version after this consumer's checkpoint, if no start is given
+    :param commit bool: move the consumer's checkpoint to the latest version read, or call delta_commit_version after processing
+
+    :returns DataFrame: changed rows with `_change_type` (insert, update_postimage, delete)
+    and `_commit_version` columns, df.attrs["version"] is the latest version read
+    """
+
+    fullpath = f"{MOUNT_PATH}/{table_path}"
+
+    if not os.path.exists(fullpath):
+        logger.warning("%s not created yet", fullpath)
+        return pd.DataFrame()
+
+    try:
+        tick = timeit.default_timer()
+        dt = DeltaTable(fullpath)
+        latest = dt.version()
+
+        if starting_version is not None:
+            start = starting_version
+        elif starting_timestamp is not None:
+            start = delta_timestamp_version(dt, starting_timestamp)
+        elif consumer is not None and (
+            last := delta_consumer_version(table_path, consumer)
+        ) is not None:
+            start = last + 1
+        else:
+            start = 0
+
+        if start > latest:
+            df = pd.DataFrame()
+        elif (
+            dt.metadata().configuration.get("delta.enableChangeDataFeed", "false")
+            == "true"
+        ):
+            try:
+                df = delta_cdf_changes(dt, start, latest)
+            except Exception as error:
+                # versions before the feed was enabled have no change files
+                logger.warning("No change data feed from version %d: %s", start, error)
+                df = delta_diff_changes(fullpath, dt, start)
+        else:
+            df = delta_diff_changes(fullpath, dt, start)
+
+        df.attrs["version"] = latest
+
+        logger.info(
+            "Read %d changes in versions %d..%d of %s in %f sec",
+            len(df),
+            start,
+            latest,
+            fullpath,
+            timeit.default_timer() - tick,
+        )
+
+        if consumer is not None and commit:
+            delta_commit_version(table_path, consumer, latest)
+
+        return df
+
+    except Exception as error:
+        logger.error("Failed to read changes: %s", fullpath)
+        logger.error(error)
+        return pd.DataFrame()
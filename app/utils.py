@@ -132,11 +132,14 @@ def get_public_hostname():
         return ""
 
 
-def sample_to_incoming():
-    for _ in range(10):
-        msg = fake.profile(fields=["name", "address", "job", "sex"])
-        if streams.produce(constants.DEMO_STREAM, "incoming", json.dumps(msg)):
-            logger.info(f"Published {msg}")
+def sample_to_incoming(count: int = 10):
+    profiles = [
+        fake.profile(fields=["name", "address", "job", "sex"]) for _ in range(count)
+    ]
+    # key by name so messages spread across the topic partitions
+    messages = [(p["name"], json.dumps(p)) for p in profiles]
+    sent = streams.produce_many(constants.DEMO_STREAM, "incoming", messages)
+    logger.info(f"Published {sent} messages")
 
 
 def sample_users(count: int = 10):
@@ -324,13 +327,45 @@ def APPs(hostname: str):
 
 
 def set_bucket_list():
+    open_bucket_folder("")
+
+
+def load_bucket_page():
     st.session_state["bucket_content"] = (
-        s3.list_bucket(st.session_state["selected_bucket"])
+        s3.list_page(
+            st.session_state["selected_bucket"],
+            prefix=st.session_state["bucket_prefix"],
+            token=st.session_state["bucket_tokens"][-1],
+        )
         if st.session_state["selected_bucket"]
         else None
     )
 
 
+def open_bucket_folder(prefix: str):
+    st.session_state["bucket_prefix"] = prefix
+    # continuation tokens of the pages visited so far, "" is the first page
+    st.session_state["bucket_tokens"] = [""]
+    load_bucket_page()
+
+
+def next_bucket_page():
+    st.session_state["bucket_tokens"].append(st.session_state["bucket_content"]["next"])
+    load_bucket_page()
+
+
+def previous_bucket_page():
+    if len(st.session_state["bucket_tokens"]) > 1:
+        st.session_state["bucket_tokens"].pop()
+    load_bucket_page()
+
+
+def refresh_bucket_list():
+    if st.session_state["selected_bucket"]:
+        s3.invalidate_listing(st.session_state["selected_bucket"])
+    load_bucket_page()
+
+
 def set_folder_list():
     st.session_state["folder_content"] = (
         get_folder_list(st.session_state["selected_folder"])
@@ -485,16 +520,17 @@ def dir_stats(folder: str):
 
 async def parquet_stats(filepath: str):
     try:
-        df = pd.read_parquet(filepath)
+        # Footer only, no data pages are read for counts and schema
+        metadata = s3.parquet_metadata(filepath)
         st.write(f"**Stats for {filepath}**")
         # Basic stats
-        st.write(f"👥 Total users: {len(df)}")
-        st.write(f"📦 Columns: {list(df.columns)}")
+        st.write(f"👥 Total users: {metadata['rows']}")
+        st.write(f"📦 Columns: {list(metadata['schema'])}")
 
         # Value counts (example)
-        if "sex" in df.columns:
+        if "sex" in metadata["schema"] and not filepath.startswith("s3://"):
             st.write("🔐 Gender distribution:")
-            st.write(df["sex"].value_counts())
+            st.write(pd.read_parquet(filepath, columns=["sex"])["sex"].value_counts())
 
     except Exception as error:
         logger.warning("Bucket stat error %s", error)